@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+朋友圈HTML生成器 - 多目录批量生成
+
+对多个朋友圈根目录（每个账号一个）分别生成HTML时间线。各目录在进程池中并行生成，
+朋友圈文件夹最多的目录最先开始，以免最大的目录最后才开始而拖长总耗时；
+某个目录生成失败时继续生成其余目录，最后打印汇总表。
+
+用法示例:
+    python batch_generate.py /data/moments/*
+    python batch_generate.py "/data/moments/*" --jobs 4 --search
+    python batch_generate.py /data/a /data/b --output-dir /data/timelines
+"""
+
+import os
+import io
+import sys
+import glob
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from direct_html_generator import (MomentsGenerator, list_moment_folders, SCAN_WORKERS,
+                                   SHARD_MODES, DEFAULT_HTML_NAME)
+from run_stats import RunStats
+
+def expand_roots(patterns):
+    """展开目录列表中的通配符，返回去重后的朋友圈根目录列表
+
+    通配符只匹配存在的目录；直接给出的路径即使不存在也保留，由batch_generate()报告为失败。
+    """
+    roots = []
+    seen = set()
+    for pattern in patterns:
+        literal = not glob.has_magic(pattern)
+        matches = [pattern] if literal else sorted(glob.glob(pattern))
+        for path in matches:
+            path = os.path.abspath(path)
+            if (literal or os.path.isdir(path)) and path not in seen:
+                seen.add(path)
+                roots.append(path)
+    return roots
+
+def archive_size(root):
+    """估计目录的生成开销：朋友圈文件夹数量（只列目录，不读取文件夹内容）"""
+    try:
+        return len(list_moment_folders(root))
+    except OSError:
+        return 0
+
+def output_file_for(root, output_dir=None):
+    """目录对应的输出文件：默认保存在目录自身中，指定output_dir时为<output_dir>/<目录名>.html"""
+    if output_dir is None:
+        return os.path.join(root, DEFAULT_HTML_NAME)
+    return os.path.join(output_dir, f"{os.path.basename(root)}.html")
+
+def _generate_archive(generator):
+    """在子进程中生成一个目录，返回(输出文件, 朋友圈数, 耗时)；生成日志不输出"""
+    stats = RunStats()
+    with contextlib.redirect_stdout(io.StringIO()):
+        output_file = generator.generate(stats=stats)
+    return output_file, stats.counters.get('folders_accepted', 0), stats.total_seconds
+
+def batch_generate(roots, jobs=None, output_dir=None, **options):
+    """并行生成多个目录，返回结果列表[(目录, 状态, 朋友圈数, 耗时, 输出文件或错误信息)]
+    
+    jobs为同时生成的目录数（默认为CPU核数），options为MomentsGenerator的选项。
+    结果按目录大小从大到小排列，不存在的目录直接记为失败并排在最后；状态为'ok'或'failed'。
+    """
+    results = {}
+    for root in roots:
+        if not os.path.isdir(root):
+            results[root] = (root, 'failed', 0, None, "目录不存在或不是目录")
+            print(f"❌ {root}: 目录不存在或不是目录")
+    sizes = {root: archive_size(root) for root in roots if root not in results}
+    ordered = sorted(sizes, key=lambda root: sizes[root], reverse=True)
+    
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        names = [os.path.basename(root) for root in ordered]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"以下目录名重复，无法输出到同一目录: {', '.join(duplicates)}")
+    
+    jobs = min(jobs or os.cpu_count() or 1, len(ordered)) or 1
+    # 进程池按提交顺序取任务，最大的目录最先开始
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for root in ordered:
+            generator = MomentsGenerator(root, output_file_for(root, output_dir), **options)
+            futures[executor.submit(_generate_archive, generator)] = root
+        for future in as_completed(futures):
+            root = futures[future]
+            try:
+                output_file, count, seconds = future.result()
+            except Exception as e:
+                results[root] = (root, 'failed', sizes[root], None, f"{type(e).__name__}: {e}")
+                print(f"❌ {root}: {e}")
+            else:
+                results[root] = (root, 'ok', count, seconds, output_file)
+                print(f"✅ {root}: {count} 个朋友圈，{seconds:.2f}s")
+    missing = [root for root in roots if root not in sizes]
+    return [results[root] for root in ordered + missing]
+
+def print_summary(results, elapsed):
+    """打印汇总表，返回失败的目录数"""
+    print()
+    print("状态    朋友圈      耗时  目录 -> 输出文件/错误")
+    for root, status, count, seconds, detail in results:
+        label = "成功" if status == 'ok' else "失败"
+        seconds_text = f"{seconds:.2f}s" if seconds is not None else "-"
+        print(f"{label}  {count:>8}  {seconds_text:>8}  {root} -> {detail}")
+    
+    failed = sum(1 for result in results if result[1] != 'ok')
+    print(f"\n共 {len(results)} 个目录，成功 {len(results) - failed} 个，失败 {failed} 个，"
+          f"总耗时 {elapsed:.2f}s")
+    return failed
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="批量生成多个朋友圈目录的HTML时间线")
+    parser.add_argument('roots', nargs='+',
+                        help="朋友圈根目录，可使用通配符（如 \"/data/moments/*\"）")
+    parser.add_argument('--jobs', type=int,
+                        help="同时生成的目录数（默认: CPU核数）")
+    parser.add_argument('--output-dir',
+                        help="输出目录，每个朋友圈目录输出为<目录名>.html（默认: 输出到各目录自身）")
+    parser.add_argument('--workers', type=int, default=SCAN_WORKERS,
+                        help="每个目录扫描文件夹的并发线程数（默认: %(default)s）")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="忽略增量缓存清单，重新读取所有文件夹")
+    parser.add_argument('--shard', choices=SHARD_MODES,
+                        help="按月(month)或按年(year)分页输出")
+    parser.add_argument('--thumbnails', action='store_true',
+                        help="生成缩略图（需要Pillow）")
+    parser.add_argument('--virtual', action='store_true',
+                        help="输出分块数据文件和虚拟滚动页面")
+    parser.add_argument('--index', action='store_true',
+                        help="刷新SQLite索引并从索引读取朋友圈")
+    parser.add_argument('--search', action='store_true',
+                        help="建立全文搜索索引")
+    args = parser.parse_args()
+    
+    roots = expand_roots(args.roots)
+    if not roots:
+        print("❌ 没有找到朋友圈目录")
+        sys.exit(1)
+    
+    print(f"共 {len(roots)} 个朋友圈目录，开始批量生成...")
+    start = time.perf_counter()
+    try:
+        results = batch_generate(roots, jobs=args.jobs, output_dir=args.output_dir,
+                                 use_cache=not args.no_cache, workers=args.workers,
+                                 shard_by=args.shard, thumbnails=args.thumbnails,
+                                 virtual=args.virtual, use_index=args.index, search=args.search)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    if print_summary(results, time.perf_counter() - start):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
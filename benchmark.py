@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+朋友圈HTML生成器 - 性能基准测试
+
+生成与真实导出相同结构（<用户名>_YYYY-MM-DD-HHMM文件夹，包含text.txt、url.txt、
+img_*图片和视频）的合成朋友圈目录，分别测量generate_html()各阶段
+（扫描、解析、排序、渲染、写入）的耗时、吞吐量和峰值内存，
+并可与保存的基准结果比较，发现性能退化。
+
+用法示例:
+    python benchmark.py --sizes 1000,10000
+    python benchmark.py --sizes 1000,10000 --save-baseline bench_baseline.json
+    python benchmark.py --sizes 1000,10000 --baseline bench_baseline.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import datetime
+import tracemalloc
+import contextlib
+
+import direct_html_generator as generator
+
+# 合成目录的默认存放位置
+DEFAULT_WORKDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_archives')
+# 合成目录生成完成的标记文件
+ARCHIVE_MARKER = '.bench_archive.json'
+# 合成数据格式版本，变化时重新生成合成目录
+ARCHIVE_VERSION = 2
+# 耗时超过基准多少比例视为退化
+DEFAULT_THRESHOLD = 0.2
+# 耗时差异小于该秒数时不视为退化（避免极短阶段的计时噪声）
+MIN_REGRESSION_SECONDS = 0.01
+
+# 最小的JPEG文件头（SOI + SOF0，1080x1440），足以被按文件头读取尺寸的工具识别
+FAKE_JPEG = bytes.fromhex('ffd8ffc000110805a0043803012200021101031101ffd9')
+# 最小的MP4文件头（ftyp，主品牌isom，兼容品牌isom、avc1）
+FAKE_MP4 = bytes.fromhex('000000186674797069736f6d0000020069736f6d61766331')
+
+SAMPLE_TEXTS = [
+    "今天天气真好，出去走走。",
+    "分享一篇文章，值得一读。",
+    "周末和朋友一起爬山，风景很美！",
+    "Happy new year! 新年快乐 🎉",
+    "加班到深夜，终于把项目上线了。",
+]
+
+def make_synthetic_archive(root, count, seed=42):
+    """在root下生成count个合成朋友圈文件夹，已生成过相同规模时直接复用"""
+    marker = os.path.join(root, ARCHIVE_MARKER)
+    try:
+        with open(marker, 'r', encoding='utf-8') as f:
+            if json.load(f) == {'version': ARCHIVE_VERSION, 'count': count, 'seed': seed}:
+                return root
+    except (OSError, ValueError):
+        pass
+    
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    os.makedirs(root)
+    rng = random.Random(seed)
+    moment_time = datetime.datetime(2014, 1, 1)
+    for i in range(count):
+        # 时间递增保证文件夹名唯一
+        moment_time += datetime.timedelta(minutes=rng.randint(1, 600))
+        folder = os.path.join(root, f"用户{i % 3}(wxid_{i % 3:04d})_{moment_time:%Y-%m-%d-%H%M}")
+        os.makedirs(folder)
+        with open(os.path.join(folder, 'text.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"{rng.choice(SAMPLE_TEXTS)} #{i}\n" * rng.randint(1, 4))
+        if rng.random() < 0.3:
+            with open(os.path.join(folder, 'url.txt'), 'w', encoding='utf-8') as f:
+                f.write(f"https://example.com/article/{i}?from=timeline&id={rng.randint(1, 10**9)}")
+        for k in range(rng.choice((0, 0, 1, 1, 2, 3, 4, 6, 9))):
+            with open(os.path.join(folder, f'img_{k + 1}.jpg'), 'wb') as f:
+                f.write(FAKE_JPEG)
+        if rng.random() < 0.1:
+            with open(os.path.join(folder, 'video.mp4'), 'wb') as f:
+                f.write(FAKE_MP4)
+    
+    with open(marker, 'w', encoding='utf-8') as f:
+        json.dump({'version': ARCHIVE_VERSION, 'count': count, 'seed': seed}, f)
+    return root
+
+def _timed(func, *args, **kwargs):
+    """执行函数并返回(结果, 耗时秒数)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def _peak_memory(func, *args, **kwargs):
+    """执行函数并返回Python堆内存峰值（字节）"""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _write_fragments(output_file, fragments):
+    """与write_html_stream()相同的方式写入已渲染的片段（缓冲临时文件后原子替换）"""
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', buffering=generator.WRITE_BUFFER_SIZE) as f:
+        f.write(generator.render_page_head("benchmark"))
+        f.writelines(fragments)
+        f.write(generator.PAGE_TAIL)
+    os.replace(tmp_path, output_file)
+
+def _generate(root, output_file, use_cache):
+    """以指定目录和输出文件运行一次完整生成，不输出日志"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.MomentsGenerator(root, output_file, use_cache=use_cache).generate()
+
+def _remove_files(paths):
+    """删除存在的文件"""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def run_benchmark(root, count):
+    """对一个合成目录测量各阶段耗时，返回结果字典"""
+    output_file = os.path.join(root, 'bench_output.html')
+    stages = {}
+    
+    folders, stages['scan'] = _timed(generator.list_moment_folders, root)
+    loaded, stages['parse'] = _timed(lambda: [generator._load_folder(root, folder, {})[0]
+                                              for folder in folders])
+    moments = [moment for moment in loaded if moment is not None]
+    moments.reverse()
+    _, stages['sort'] = _timed(moments.sort, key=generator.MOMENT_SORT_KEY, reverse=True)
+    fragments, stages['render'] = _timed(lambda: [generator.render_moment(moment, root)
+                                                  for moment in moments])
+    _, stages['write'] = _timed(_write_fragments, output_file, fragments)
+    output_bytes = os.path.getsize(output_file)
+    del loaded, moments, fragments
+    
+    # 端到端：不使用缓存（冷启动）与使用增量缓存（无变化的重新生成）；
+    # 合成目录会被复用，冷启动前删除上次留下的缓存清单、片段缓存和运行报告
+    leftovers = [os.path.join(root, generator.MANIFEST_NAME),
+                 generator.fragment_cache_path_for(output_file),
+                 generator.report_path_for(output_file)]
+    _remove_files(leftovers)
+    _, stages['total_cold'] = _timed(_generate, root, output_file, True)
+    _, stages['total_cached'] = _timed(_generate, root, output_file, True)
+    peak = _peak_memory(_generate, root, output_file, False)
+    _remove_files([output_file] + leftovers)
+    
+    return {
+        'count': count,
+        'seconds': stages,
+        'moments_per_second': {stage: count / seconds if seconds else None
+                               for stage, seconds in stages.items()},
+        'peak_memory_bytes': peak,
+        'output_bytes': output_bytes,
+    }
+
+def compare_with_baseline(results, baseline, threshold):
+    """与基准结果比较，返回退化项列表[(规模, 阶段, 基准耗时, 当前耗时)]"""
+    regressions = []
+    for count, result in results.items():
+        base = baseline.get(count)
+        if not base:
+            continue
+        for stage, seconds in result['seconds'].items():
+            base_seconds = base['seconds'].get(stage)
+            if (base_seconds and seconds > base_seconds * (1 + threshold)
+                    and seconds - base_seconds >= MIN_REGRESSION_SECONDS):
+                regressions.append((count, stage, base_seconds, seconds))
+    return regressions
+
+def print_report(results):
+    """以表格形式输出结果"""
+    stages = ['scan', 'parse', 'sort', 'render', 'write', 'total_cold', 'total_cached']
+    print(f"{'规模':>8} " + " ".join(f"{stage:>12}" for stage in stages) + f" {'峰值内存':>10} {'输出大小':>10}")
+    for count, result in results.items():
+        seconds = " ".join(f"{result['seconds'][stage]:>11.3f}s" for stage in stages)
+        print(f"{count:>8} {seconds} {result['peak_memory_bytes'] / 2**20:>8.1f}MB "
+              f"{result['output_bytes'] / 2**20:>8.1f}MB")
+    print()
+    print(f"{'规模':>8} " + " ".join(f"{stage:>12}" for stage in stages) + "  (条/秒)")
+    for count, result in results.items():
+        rates = " ".join(f"{result['moments_per_second'][stage] or 0:>12.0f}" for stage in stages)
+        print(f"{count:>8} {rates}")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="朋友圈HTML生成器性能基准测试")
+    parser.add_argument('--sizes', default='1000,10000',
+                        help="合成目录的朋友圈数量，逗号分隔（默认: %(default)s，最大可到200000）")
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR,
+                        help="合成目录的存放位置，已生成的目录会被复用（默认: %(default)s）")
+    parser.add_argument('--baseline', help="与该基准结果文件比较，发现退化时以非零状态退出")
+    parser.add_argument('--save-baseline', help="将本次结果保存为基准结果文件")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="耗时超过基准多少比例视为退化（默认: %(default)s）")
+    parser.add_argument('--output', help="将本次结果以JSON格式写入该文件")
+    args = parser.parse_args()
+    
+    results = {}
+    for count in (int(size) for size in args.sizes.split(',')):
+        root = os.path.join(args.workdir, f"archive_{count}")
+        print(f"准备 {count} 条朋友圈的合成目录: {root}")
+        make_synthetic_archive(root, count)
+        print(f"测试 {count} 条朋友圈...")
+        results[str(count)] = run_benchmark(root, count)
+    
+    print()
+    print_report(results)
+    
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {path}")
+    
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n⚠️ 发现 {len(regressions)} 项性能退化（阈值 {args.threshold:.0%}）:")
+            for count, stage, base_seconds, seconds in regressions:
+                print(f"  {count} 条 {stage}: {base_seconds:.3f}s -> {seconds:.3f}s "
+                      f"(+{seconds / base_seconds - 1:.0%})")
+            sys.exit(1)
+        print("\n✅ 未发现性能退化")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件内容哈希及其持久化缓存
+
+按文件的修改时间和大小缓存内容哈希，文件未变化时无需重新读取计算。
+缩略图、导出、合并等按内容去重的功能共用这里的缓存实现，各自使用独立的缓存文件
+（save(prune=True)会清除本次未访问的条目，不能在功能之间共享同一个文件）。
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+# 计算哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_digest(path):
+    """计算文件内容的SHA-1哈希"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class FileHashCache:
+    """以(修改时间, 大小)为键的文件哈希缓存，可被多个线程同时使用"""
+    
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._seen = set()
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+    
+    def hash_file(self, path):
+        """返回文件内容哈希，文件的修改时间和大小未变化时直接使用缓存"""
+        key = os.path.abspath(path)
+        st = os.stat(key)
+        with self._lock:
+            self._seen.add(key)
+            entry = self._entries.get(key)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+        
+        digest = file_digest(key)
+        with self._lock:
+            self._entries[key] = [st.st_mtime_ns, st.st_size, digest]
+            self._dirty = True
+        return digest
+    
+    def save(self, prune=False):
+        """原子地写回缓存文件，prune为True时丢弃本次未访问过的条目"""
+        with self._lock:
+            if prune:
+                stale = [key for key in self._entries if key not in self._seen]
+                for key in stale:
+                    del self._entries[key]
+                self._dirty = self._dirty or bool(stale)
+            if not self._dirty:
+                return
+            tmp_path = f"{self.cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._entries, f, ensure_ascii=False)
+                os.replace(tmp_path, self.cache_file)
+                self._dirty = False
+            except OSError as e:
+                print(f"写入哈希缓存失败: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
@@ -2,24 +2,86 @@
 # -*- coding: utf-8 -*-
 import os
 import re
+import sys
+import calendar
 import datetime
 import html
+import json
+import shutil
+import sqlite3
+import hashlib
+import itertools
+import array
+import operator
+import argparse
+import time
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from thumbnails import build_thumbnails, THUMB_DIR_NAME
+from pipeline import Pipeline
+from media_probe import probe_image_size, probe_video
+from search_index import write_search_index, search_dir_for, SEARCH_SHARDS, DOC_CHUNK_SIZE
+from run_stats import RunStats
 
 # 朋友圈根目录
 MOMENTS_DIR = '/Users/mac/Desktop/moments'
+# 默认输出文件名（保存在朋友圈根目录下）
+DEFAULT_HTML_NAME = 'moments_timeline_direct.html'
 # 输出文件路径
-HTML_FILE = os.path.join(MOMENTS_DIR, 'moments_timeline_direct.html')
+HTML_FILE = os.path.join(MOMENTS_DIR, DEFAULT_HTML_NAME)
+# 增量缓存清单文件名（保存在朋友圈根目录下）
+MANIFEST_NAME = '.moments_manifest.json'
+# 清单格式版本，格式变化时递增以使旧缓存失效
+MANIFEST_VERSION = 3
+# 扫描文件夹的默认并发线程数（1表示顺序扫描）
+SCAN_WORKERS = 1
+# 流水线模式下渲染朋友圈片段的默认线程数
+RENDER_WORKERS = 1
+# 流水线模式下每个任务处理的文件夹数
+PIPELINE_CHUNK_SIZE = 64
+# 渐进式生成时写入多少条朋友圈后第一次发布部分页面（之后每当条数翻倍时再发布）
+PROGRESSIVE_FIRST_BATCH = 100
+
+# 朋友圈文件夹名称格式：<用户名>_YYYY-MM-DD-HHMM
+FOLDER_PATTERN = re.compile(r'_[0-9]{4}-[0-9]{2}-[0-9]{2}-[0-9]{4}$')
+
+class GenerationCancelled(Exception):
+    """生成过程被取消（通过cancel_event请求）"""
+
+def _checkpoint(cancel_event, progress=None, stage=None, done=0, total=0):
+    """检查是否已请求取消（已请求时抛出GenerationCancelled），并报告进度
+
+    progress为回调函数progress(stage, done, total)，total为0表示总数未知。
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        raise GenerationCancelled("生成已取消")
+    if progress is not None:
+        progress(stage, done, total)
 
 def extract_datetime(folder_name):
-    """从文件夹名称中提取日期时间信息"""
-    match = re.search(r'_([0-9]{4}-[0-9]{2}-[0-9]{2}-[0-9]{4})$', folder_name)
-    if match:
-        date_time_str = match.group(1)
-        try:
-            return datetime.datetime.strptime(date_time_str, '%Y-%m-%d-%H%M')
-        except ValueError:
-            return None
-    return None
+    """从文件夹名称中提取日期时间信息
+
+    名称末尾为固定宽度的YYYY-MM-DD-HHMM，按位置切片转换（比strptime快得多，
+    按日期筛选时每个文件夹都要调用），日期无效时返回None。
+    """
+    if not FOLDER_PATTERN.search(folder_name):
+        return None
+    stamp = folder_name[-15:]
+    try:
+        return datetime.datetime(int(stamp[0:4]), int(stamp[5:7]), int(stamp[8:10]),
+                                 int(stamp[11:13]), int(stamp[13:15]))
+    except ValueError:
+        return None
+
+def to_timestamp(moment_datetime):
+    """将文件夹名中的日期时间转换为整数时间戳（秒，按UTC计算，不受时区影响）"""
+    return calendar.timegm(moment_datetime.timetuple())
+
+def from_timestamp(ts):
+    """将整数时间戳还原为datetime"""
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=ts)
 
 def get_user_name(folder_name):
     """从文件夹名称中提取用户名"""
@@ -31,89 +93,360 @@ def get_user_name(folder_name):
         return clean_username.strip()
     return "未知用户"
 
-def get_moment_content(folder_path):
-    """获取朋友圈内容，包括文本、图片和链接"""
-    content = {}
+def parse_date(text):
+    """解析YYYY-MM-DD格式的日期，格式错误时抛出ValueError"""
+    return datetime.datetime.strptime(text.strip(), '%Y-%m-%d').date()
+
+class MomentFilter:
+    """只根据文件夹名称（extract_datetime/get_user_name）筛选朋友圈
+
+    start/end为date或datetime，包含两端（end为date时包含当天全天）；users为用户名集合。
+    筛选在读取文件夹内任何文件之前进行，被排除的文件夹只花费一次目录列举。
+    实例可以直接作为folder_filter调用，也可以传给子进程。
+    """
     
-    # 获取文本内容
-    text_file = os.path.join(folder_path, 'text.txt')
-    if os.path.exists(text_file):
-        try:
-            with open(text_file, 'r', encoding='utf-8') as f:
-                content['text'] = f.read().strip()
-        except Exception as e:
-            content['text'] = f"[读取文本出错: {str(e)}]"
-    else:
-        content['text'] = ""
+    def __init__(self, start=None, end=None, users=None):
+        if isinstance(start, datetime.date) and not isinstance(start, datetime.datetime):
+            start = datetime.datetime.combine(start, datetime.time.min)
+        if isinstance(end, datetime.date) and not isinstance(end, datetime.datetime):
+            end = datetime.datetime.combine(end, datetime.time(23, 59))
+        self.start = start
+        self.end = end
+        self.users = frozenset(users) if users else None
     
-    # 获取链接内容
-    url_file = os.path.join(folder_path, 'url.txt')
-    if os.path.exists(url_file):
-        try:
-            with open(url_file, 'r', encoding='utf-8') as f:
-                content['url'] = f.read().strip()
-        except Exception as e:
-            content['url'] = ""
-    else:
-        content['url'] = ""
+    def __call__(self, folder_name):
+        if self.start is not None or self.end is not None:
+            moment_datetime = extract_datetime(folder_name)
+            if moment_datetime is None:
+                return False
+            if self.start is not None and moment_datetime < self.start:
+                return False
+            if self.end is not None and moment_datetime > self.end:
+                return False
+        if self.users is not None and get_user_name(folder_name) not in self.users:
+            return False
+        return True
     
-    # 获取图片列表
-    content['images'] = []
-    for file in os.listdir(folder_path):
-        if file.startswith('img_') and (file.endswith('.jpg') or file.endswith('.png')):
-            content['images'].append(os.path.join(folder_path, file))
+    def to_dict(self):
+        """筛选条件（写入运行报告）"""
+        return {
+            'start': self.start.isoformat() if self.start else None,
+            'end': self.end.isoformat() if self.end else None,
+            'users': sorted(self.users) if self.users else None,
+        }
+
+def _read_text_file(path, stats=None):
+    """读取文本文件内容（换行符统一为\n）并去掉首尾空白"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if stats:
+        stats.incr('files_read')
+        stats.incr('bytes_read', len(data))
+    return data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n').strip()
+
+def get_moment_content(folder_path, stats=None):
+    """获取朋友圈内容，包括文本、图片和链接
+
+    只对文件夹做一次os.scandir，文本/链接文件是否存在以及图片、视频列表都从同一次列举结果得到。
+    图片尺寸只读取文件头得到（image_sizes，与images一一对应，无法识别时为None）；
+    视频信息只读取容器头部得到（video_info，与videos一一对应，[MIME类型, 时长, 宽, 高]）。
+    stats为RunStats时累加读取的文件数和字节数。
+    """
+    content = {'text': "", 'url': "", 'images': [], 'videos': [], 'image_sizes': [], 'video_info': []}
     
-    # 获取视频列表
-    content['videos'] = []
-    for file in os.listdir(folder_path):
-        if file.endswith('.mp4') or file.endswith('.mov') or file.endswith('.avi'):
+    with os.scandir(folder_path) as it:
+        names = sorted(entry.name for entry in it)
+    
+    for file in names:
+        # 获取文本内容
+        if file == 'text.txt':
+            try:
+                content['text'] = _read_text_file(os.path.join(folder_path, file), stats)
+            except Exception as e:
+                content['text'] = f"[读取文本出错: {str(e)}]"
+        # 获取链接内容
+        elif file == 'url.txt':
+            try:
+                content['url'] = _read_text_file(os.path.join(folder_path, file), stats)
+            except Exception as e:
+                content['url'] = ""
+        # 获取图片列表
+        elif file.startswith('img_') and (file.endswith('.jpg') or file.endswith('.png')):
+            content['images'].append(os.path.join(folder_path, file))
+        # 获取视频列表
+        elif file.endswith('.mp4') or file.endswith('.mov') or file.endswith('.avi'):
             content['videos'].append(os.path.join(folder_path, file))
+    
+    for path in content['images']:
+        size = probe_image_size(path)
+        content['image_sizes'].append(list(size) if size else None)
+    content['video_info'] = [list(probe_video(path)) for path in content['videos']]
+    if stats:
+        stats.incr('images_probed', len(content['images']))
+        stats.incr('videos_probed', len(content['videos']))
 
     return content
 
-def generate_html():
-    """直接生成HTML文档"""
+def _freeze(items):
+    """将JSON读出的列表转换为元组（嵌套的列表同样转换），空列表统一为()"""
+    if not items:
+        return ()
+    return tuple(tuple(item) if isinstance(item, list) else item for item in items)
+
+def _pack_sizes(sizes):
+    """将[[宽, 高]或None, ...]压缩为扁平的array('I')（未知尺寸记为0, 0），没有尺寸时为()"""
+    if not sizes:
+        return ()
+    return array.array('I', [value for size in sizes for value in (size or (0, 0))])
+
+def _signature_digest(signature):
+    """将文件夹签名（folder_signature()的结果）压缩为一个64位整数，只用于判断是否变化"""
+    return int.from_bytes(hashlib.blake2b(repr(signature).encode('ascii'), digest_size=8).digest(),
+                          'big')
+
+class Moment:
+    """单条朋友圈的紧凑表示
+
+    时间保存为整数时间戳，用户名经过sys.intern()在所有朋友圈间共享；
+    图片和视频只保存文件名，root为朋友圈根目录（所有朋友圈共用同一个字符串），
+    需要时再拼出完整路径。video_info与videos一一对应；图片尺寸按[宽, 高, 宽, 高, ...]
+    扁平保存在array中（通过image_size_list()读取），文件夹签名只保存其64位摘要。
+    """
+    
+    __slots__ = ('ts', 'user', 'folder', 'root', 'text', 'url', 'images', 'videos',
+                 'image_sizes', 'video_info', 'signature')
+    
+    def __init__(self, ts, user, folder, root, text="", url="", images=(), videos=(),
+                 image_sizes=(), video_info=(), signature=()):
+        self.ts = ts
+        self.user = sys.intern(user)
+        self.folder = folder
+        self.root = root
+        self.text = text
+        self.url = url
+        self.images = _freeze(images)
+        self.videos = _freeze(videos)
+        self.image_sizes = _pack_sizes(image_sizes)
+        self.video_info = _freeze(video_info)
+        self.signature = _signature_digest(signature)
+    
+    @property
+    def datetime(self):
+        """发布时间（datetime）"""
+        return from_timestamp(self.ts)
+    
+    @property
+    def folder_path(self):
+        """朋友圈文件夹的完整路径"""
+        return os.path.join(self.root, self.folder)
+    
+    def image_size_list(self):
+        """与images一一对应的图片尺寸列表[(宽, 高)]，尺寸未知的为None"""
+        sizes = self.image_sizes
+        if not sizes:
+            return [None] * len(self.images)
+        return [(sizes[i], sizes[i + 1]) if sizes[i] else None for i in range(0, len(sizes), 2)]
+    
+    def image_paths(self):
+        """图片的完整路径列表"""
+        folder_path = self.folder_path
+        return [os.path.join(folder_path, name) for name in self.images]
+    
+    def video_paths(self):
+        """视频的完整路径列表"""
+        folder_path = self.folder_path
+        return [os.path.join(folder_path, name) for name in self.videos]
+
+# 朋友圈排序键：整数时间戳
+MOMENT_SORT_KEY = operator.attrgetter('ts')
+
+def folder_sort_key(folder):
+    """只按文件夹名得到的排序键(时间戳, 文件夹名)，按该键从大到小排序即为时间线顺序
+
+    与先按文件夹名排序、再按时间戳从新到旧稳定排序的结果相同；
+    名称中日期无效的文件夹排在最后（读取时会被跳过）。
+    """
+    moment_datetime = extract_datetime(folder)
+    return (to_timestamp(moment_datetime) if moment_datetime else -1), folder
+
+def folder_signature(folder_path):
+    """计算文件夹签名：文件夹本身及text.txt、url.txt的修改时间和大小
+
+    增删图片/视频会改变文件夹的修改时间，原地修改文本则由文本文件的签名反映。
+    """
+    signature = []
+    for path in (folder_path,
+                 os.path.join(folder_path, 'text.txt'),
+                 os.path.join(folder_path, 'url.txt')):
+        try:
+            st = os.stat(path)
+            signature.append([st.st_mtime_ns, st.st_size])
+        except OSError:
+            signature.append(None)
+    return signature
+
+def load_manifest(moments_dir):
+    """读取增量缓存清单，清单不存在或损坏时返回空字典"""
+    manifest_path = os.path.join(moments_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('version') != MANIFEST_VERSION:
+        return {}
+    return data.get('folders', {})
+
+def save_manifest(moments_dir, entries):
+    """原子地写入增量缓存清单（先写临时文件再重命名）"""
+    manifest_path = os.path.join(moments_dir, MANIFEST_NAME)
+    tmp_path = _tmp_path(manifest_path)
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'folders': entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+    except OSError as e:
+        print(f"写入缓存清单失败: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def _pack_content(content):
+    """将内容中的绝对路径转换为文件名，便于缓存（目录移动后缓存依然有效）"""
+    return {
+        'text': content['text'],
+        'url': content['url'],
+        'images': [os.path.basename(p) for p in content['images']],
+        'videos': [os.path.basename(p) for p in content['videos']],
+        'image_sizes': content['image_sizes'],
+        'video_info': content['video_info'],
+    }
+
+def _load_folder(moments_dir, folder, manifest, changed_folders=None, stats=None):
+    """读取单个朋友圈文件夹，返回(朋友圈, 清单条目, 是否命中缓存)
+
+    文件夹名称不符合格式时返回(None, None, False)。changed_folders不为None时，
+    不在其中且已有缓存的文件夹视为未变化，直接使用缓存而不检查签名。
+    """
+    moment_datetime = extract_datetime(folder)
+    if not moment_datetime:
+        if stats:
+            stats.incr('folders_skipped')
+        return None, None, False
+    
+    folder_path = os.path.join(moments_dir, folder)
+    
+    cached = manifest.get(folder)
+    if cached and changed_folders is not None and folder not in changed_folders:
+        signature = cached['sig']
+    else:
+        signature = folder_signature(folder_path)
+        if stats:
+            stats.incr('files_stat', len(signature))
+    if cached and cached.get('sig') == signature:
+        packed = cached['content']
+        reused = True
+    else:
+        packed = _pack_content(get_moment_content(folder_path, stats))
+        reused = False
+    
+    # 朋友圈直接引用清单条目中的字符串，不另外复制
+    moment = Moment(to_timestamp(moment_datetime), get_user_name(folder), folder, moments_dir,
+                    packed['text'], packed['url'], packed['images'], packed['videos'],
+                    packed['image_sizes'], packed['video_info'], signature)
+    return moment, {'sig': signature, 'content': packed}, reused
+
+def list_moment_folders(moments_dir, stats=None):
+    """列出朋友圈根目录下名称符合格式的子文件夹（一次os.scandir）"""
+    folders = []
+    seen = 0
+    with os.scandir(moments_dir) as it:
+        for entry in it:
+            seen += 1
+            if FOLDER_PATTERN.search(entry.name) and entry.is_dir():
+                folders.append(entry.name)
+    folders.sort()
+    if stats:
+        stats.incr('folders_seen', seen)
+        stats.incr('folders_skipped', seen - len(folders))
+    return folders
+
+def _scan_folders(moments_dir, use_cache, folder_filter, stats):
+    """列出（并筛选）朋友圈文件夹，返回(文件夹列表, 缓存清单, 新清单)
+
+    新清单中预先放入被筛选排除的文件夹原有的缓存条目。
+    """
+    manifest = load_manifest(moments_dir) if use_cache else {}
+    new_manifest = {}
+    folders = list_moment_folders(moments_dir, stats)
+    if folder_filter is not None:
+        selected = [folder for folder in folders if folder_filter(folder)]
+        if use_cache:
+            selected_set = set(selected)
+            new_manifest = {folder: manifest[folder] for folder in folders
+                            if folder not in selected_set and folder in manifest}
+        stats.incr('folders_filtered', len(folders) - len(selected))
+        folders = selected
+    return folders, manifest, new_manifest
+
+def collect_moments(moments_dir, use_cache=True, workers=1, changed_folders=None, stats=None,
+                    progress=None, cancel_event=None, folder_filter=None, save_cache=True):
+    """遍历朋友圈目录，返回按文件夹名排序的朋友圈（Moment）列表
+
+    use_cache为True时，签名未变化的文件夹直接使用缓存清单中的内容，
+    只有新增或修改过的文件夹才会重新读取。
+    workers大于1时使用线程池并发读取文件夹，适合NFS/SMB等高延迟的网络存储；
+    结果顺序与顺序扫描一致。
+    changed_folders为已知发生变化的文件夹名集合（如监视模式提供），其余文件夹不检查签名。
+    folder_filter为按文件夹名筛选的函数（如MomentFilter），未通过的文件夹不读取，
+    其缓存条目原样保留在清单中。
+    stats为RunStats时记录扫描、读取两个阶段的耗时及相关计数。
+    progress/cancel_event用于报告进度和取消，取消时抛出GenerationCancelled且不写缓存清单。
+    save_cache为False时只读取已有的缓存清单，不写回（不在朋友圈根目录中写入文件）。
+    """
+    stats = stats or RunStats()
     moments = []
+    reused = 0
     
     # 遍历朋友圈文件夹
-    for folder in os.listdir(MOMENTS_DIR):
-        folder_path = os.path.join(MOMENTS_DIR, folder)
-        
-        if not os.path.isdir(folder_path) or not re.search(r'_[0-9]{4}-[0-9]{2}-[0-9]{2}-[0-9]{4}$', folder):
-            continue
-        
-        moment_datetime = extract_datetime(folder)
-        if not moment_datetime:
-            continue
-        
-        user_name = get_user_name(folder)
-        content = get_moment_content(folder_path)
-        
-        moments.append({
-            'datetime': moment_datetime,
-            'user': user_name,
-            'content': content,
-            'folder': folder
-        })
+    _checkpoint(cancel_event, progress, 'scan')
+    with stats.stage('scan'):
+        folders, manifest, new_manifest = _scan_folders(moments_dir, use_cache, folder_filter, stats)
     
-    # 按时间排序（从新到旧）
-    moments.sort(key=lambda x: x['datetime'], reverse=True)
+    def load(folder):
+        # 已请求取消时线程池中尚未开始的任务立即结束
+        _checkpoint(cancel_event)
+        return _load_folder(moments_dir, folder, manifest, changed_folders, stats)
     
-    # 获取用户名用于标题
-    user_title = "朋友圈时间线"  # 默认标题
-    if moments:
-        user_title = f"{moments[0]['user']}朋友圈"
+    with stats.stage('parse'):
+        pool = ThreadPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+        try:
+            results = pool.map(load, folders) if pool else map(load, folders)
+            for done, (folder, (moment, entry, hit)) in enumerate(zip(folders, results), 1):
+                _checkpoint(cancel_event, progress, 'parse', done, len(folders))
+                if moment is None:
+                    continue
+                new_manifest[folder] = entry
+                moments.append(moment)
+                if hit:
+                    reused += 1
+        finally:
+            if pool:
+                pool.shutdown(wait=True, cancel_futures=True)
     
-    # 生成HTML
-    html_content = f"""
-<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{html.escape(user_title)}</title>
-    <style>
-        body {{
+    stats.incr('folders_accepted', len(moments))
+    stats.incr('cache_hits', reused)
+    if use_cache:
+        if save_cache:
+            save_manifest(moments_dir, new_manifest)
+        print(f"缓存命中 {reused} 个文件夹，重新读取 {len(moments) - reused} 个文件夹")
+    
+    return moments
+
+# 页面样式
+PAGE_STYLE = """
+        body {
             font-family: "PingFang SC", "Hiragino Sans GB", "Microsoft YaHei", "WenQuanYi Micro Hei", sans-serif;
             line-height: 1.6;
             color: #333;
@@ -121,58 +454,58 @@ def generate_html():
             margin: 0 auto;
             padding: 20px;
             background-color: #f8f9fa;
-        }}
+        }
         
-        .container {{
+        .container {
             background-color: white;
             padding: 30px;
             border-radius: 8px;
             box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }}
+        }
         
-        h1 {{
+        h1 {
             color: #2c3e50;
             text-align: center;
             border-bottom: 3px solid #3498db;
             padding-bottom: 15px;
             margin-bottom: 30px;
-        }}
+        }
         
-        .moment {{
+        .moment {
             margin-bottom: 30px;
             padding: 20px;
             border-left: 4px solid #27ae60;
             background-color: #f8f9fa;
             border-radius: 0 8px 8px 0;
-        }}
+        }
         
-        .moment-header {{
+        .moment-header {
             margin-bottom: 15px;
-        }}
+        }
         
-        .moment-date {{
+        .moment-date {
             font-size: 1.2em;
             font-weight: bold;
             color: #2c3e50;
             margin-bottom: 5px;
-        }}
+        }
         
-        .moment-user {{
+        .moment-user {
             color: #e74c3c;
             font-weight: bold;
-        }}
+        }
         
-        .moment-content {{
+        .moment-content {
             margin: 15px 0;
             line-height: 1.8;
             white-space: pre-wrap;
-        }}
+        }
         
-        .moment-images {{
+        .moment-images {
             margin-top: 15px;
-        }}
+        }
         
-        .moment-images img {{
+        .moment-images img {
             width: 180px;
             height: 180px;
             object-fit: cover;
@@ -180,109 +513,1628 @@ def generate_html():
             border: 1px solid #ddd;
             border-radius: 4px;
             box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-        }}
+        }
         
-        .moment-videos {{
+        .moment-images.single img {
+            width: auto;
+            height: auto;
+            max-width: min(360px, 100%);
+            max-height: 360px;
+        }
+        
+        .moment-videos {
             margin-top: 15px;
-        }}
+        }
         
-        .moment-videos video {{
+        .moment-videos video {
             width: 300px;
             height: auto;
             margin: 5px;
             border: 1px solid #ddd;
             border-radius: 4px;
             box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-        }}
+        }
+        
+        .video-item {
+            position: relative;
+            display: inline-block;
+        }
         
-        .moment-link {{
+        .video-duration {
+            position: absolute;
+            top: 12px;
+            right: 12px;
+            padding: 1px 6px;
+            border-radius: 3px;
+            background: rgba(0,0,0,0.6);
+            color: white;
+            font-size: 12px;
+            pointer-events: none;
+        }
+        
+        .moment-link {
             margin-top: 15px;
             padding: 12px;
             background-color: #e8f4fd;
             border: 1px solid #3498db;
             border-radius: 6px;
-        }}
+        }
         
-        .moment-link a {{
+        .moment-link a {
             color: #3498db;
             text-decoration: none;
             font-weight: 500;
             word-break: break-all;
-        }}
+        }
         
-        .moment-link a:hover {{
+        .moment-link a:hover {
             color: #2980b9;
             text-decoration: underline;
-        }}
-    </style>
+        }
+        
+        .page-nav {
+            display: flex;
+            justify-content: space-between;
+            margin: 10px 0 30px;
+        }
+        
+        .page-nav a {
+            color: #3498db;
+            text-decoration: none;
+        }
+        
+        .progress-notice {
+            text-align: center;
+            color: #888;
+            padding: 20px 0;
+        }
+        
+        .progress-notice a {
+            color: #3498db;
+        }
+        
+        .shard-index h2 {
+            color: #2c3e50;
+            font-size: 1.2em;
+            margin: 20px 0 10px;
+        }
+        
+        .shard-index ul {
+            list-style: none;
+            padding: 0;
+            margin: 0;
+        }
+        
+        .shard-index li {
+            display: inline-block;
+            margin: 5px 10px 5px 0;
+        }
+        
+        .shard-index .count {
+            color: #888;
+            font-size: 0.9em;
+        }
+        
+        .search-box {
+            margin-bottom: 30px;
+        }
+        
+        .search-box input {
+            width: 100%;
+            box-sizing: border-box;
+            padding: 10px 14px;
+            font-size: 1em;
+            border: 1px solid #ccc;
+            border-radius: 6px;
+        }
+        
+        .search-results a {
+            display: block;
+            padding: 8px 0;
+            border-bottom: 1px solid #eee;
+            color: #333;
+            text-decoration: none;
+        }
+        
+        .search-results .search-date {
+            color: #3498db;
+            font-weight: bold;
+            margin-right: 8px;
+        }
+        
+        .search-summary {
+            color: #888;
+            font-size: 0.9em;
+            margin-top: 8px;
+        }
+"""
+
+# 页面结尾
+PAGE_TAIL = """
+    </div>
+</body>
+</html>
+"""
+
+# 模板版本，页面结构或样式变化时递增，使已生成的分页全部重新写入
+TEMPLATE_VERSION = 4
+
+# 分页方式：按月或按年
+SHARD_MODES = ('month', 'year')
+# 分页状态文件名（保存在分页目录下，记录每个分页的输入摘要）
+SHARD_STATE_NAME = '.shards.json'
+# 分页的片段缓存数据库文件名（保存在分页目录下，与单页输出的片段缓存分开）
+SHARD_FRAGMENT_CACHE_NAME = '.fragments.sqlite3'
+
+# 片段缓存数据库的表结构：meta保存模板版本和媒体路径的基准目录，与本次不同时清空片段
+FRAGMENT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fragments (
+    key TEXT PRIMARY KEY,
+    html TEXT NOT NULL
+);
+"""
+
+# 片段缓存每积累多少条新片段提交一次
+FRAGMENT_COMMIT_BATCH = 500
+
+# 写入HTML文件时使用的缓冲区大小
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+def render_page_head(title):
+    """生成页面开头部分（样式及标题）"""
+    return f"""
+<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{html.escape(title)}</title>
+    <style>{PAGE_STYLE}    </style>
 </head>
 <body>
     <div class="container">
-        <h1>{html.escape(user_title)}</h1>
+        <h1>{html.escape(title)}</h1>
 """
+
+def moment_anchor(moment):
+    """朋友圈在页面中的锚点，由文件夹名计算，多次生成保持不变"""
+    return 'm-' + hashlib.sha1(moment.folder.encode('utf-8')).hexdigest()[:12]
+
+# 页面内搜索脚本：切分查询词（中日韩文字两字以上的片段取二元组、单字片段取单字，
+# 索引中两种词项都有，见search_index.tokenize），只加载查询词所在的
+# 倒排表分片求交集，再加载结果所在的文档块显示结果
+SEARCH_SCRIPT = """
+(function () {
+    var config = JSON.parse(document.getElementById('moments-search-config').textContent);
+    var input = document.getElementById('moments-search-input');
+    var results = document.getElementById('moments-search-results');
+    var TOKEN_PATTERN = /[\\u3040-\\u30ff\\u3400-\\u9fff\\uf900-\\ufaff\\uac00-\\ud7af]+|[a-z0-9]+/g;
+    var MAX_RESULTS = 50;
+    var loaders = {};
+    var waiting = {};
+    var generation = 0;
+
+    function el(tag, className, text) {
+        var node = document.createElement(tag);
+        if (className) node.className = className;
+        if (text) node.textContent = text;
+        return node;
+    }
+
+    function tokenize(text) {
+        var tokens = {};
+        (text.toLowerCase().match(TOKEN_PATTERN) || []).forEach(function (run) {
+            if (run[0] <= 'z') {
+                if (run.length >= 2) tokens[run] = true;
+            } else if (run.length === 1) {
+                tokens[run] = true;
+            } else {
+                for (var i = 0; i + 1 < run.length; i++) tokens[run.slice(i, i + 2)] = true;
+            }
+        });
+        return Object.keys(tokens);
+    }
+
+    function shardOf(token) {
+        var bytes = new TextEncoder().encode(token);
+        var hash = 0x811c9dc5;
+        for (var i = 0; i < bytes.length; i++) {
+            hash ^= bytes[i];
+            hash = Math.imul(hash, 0x01000193) >>> 0;
+        }
+        return hash % config.shards;
+    }
+
+    function load(kind, i) {
+        var key = kind + '-' + i;
+        if (!loaders[key]) {
+            loaders[key] = new Promise(function (resolve, reject) {
+                waiting[key] = resolve;
+                var script = document.createElement('script');
+                script.src = config.base + key + '.js';
+                script.onload = function () { script.remove(); };
+                script.onerror = function () {
+                    script.remove();
+                    delete loaders[key];
+                    reject(new Error(key));
+                };
+                document.head.appendChild(script);
+            });
+        }
+        return loaders[key];
+    }
+
+    window.__momentsSearchShard = function (i, data) { waiting['shard-' + i](data); };
+    window.__momentsSearchDocs = function (i, data) { waiting['docs-' + i](data); };
+
+    function decode(deltas) {
+        var ids = [], id = 0;
+        for (var i = 0; i < deltas.length; i++) {
+            id += deltas[i];
+            ids.push(id);
+        }
+        return ids;
+    }
+
+    function intersect(a, b) {
+        var out = [], i = 0, j = 0;
+        while (i < a.length && j < b.length) {
+            if (a[i] === b[j]) { out.push(a[i]); i++; j++; }
+            else if (a[i] < b[j]) i++;
+            else j++;
+        }
+        return out;
+    }
+
+    function show(ids, current) {
+        var shown = ids.slice(0, MAX_RESULTS);
+        var chunkIds = [];
+        shown.forEach(function (id) {
+            var c = Math.floor(id / config.docChunk);
+            if (chunkIds.indexOf(c) < 0) chunkIds.push(c);
+        });
+        return Promise.all(chunkIds.map(function (c) { return load('docs', c); })).then(function (chunks) {
+            if (current !== generation) return;
+            results.textContent = '';
+            var summary = '找到 ' + ids.length + ' 条朋友圈';
+            if (ids.length > MAX_RESULTS) summary += '，显示最新的 ' + MAX_RESULTS + ' 条';
+            results.appendChild(el('div', 'search-summary', summary));
+            shown.forEach(function (id) {
+                var doc = chunks[chunkIds.indexOf(Math.floor(id / config.docChunk))][id % config.docChunk];
+                var link = el('a');
+                link.href = config.pagesBase + doc[1] + '#' + doc[2];
+                link.appendChild(el('span', 'search-date', doc[0]));
+                link.appendChild(document.createTextNode(doc[3]));
+                if (window.__momentsReveal) {
+                    link.onclick = function (event) {
+                        event.preventDefault();
+                        window.__momentsReveal(id, doc[2]);
+                    };
+                }
+                results.appendChild(link);
+            });
+        });
+    }
+
+    function search(query) {
+        var current = ++generation;
+        var tokens = tokenize(query);
+        if (!tokens.length) {
+            results.textContent = '';
+            return;
+        }
+        Promise.all(tokens.map(function (token) {
+            return load('shard', shardOf(token)).then(function (data) {
+                return data[token] ? decode(data[token]) : [];
+            });
+        })).then(function (lists) {
+            if (current !== generation) return;
+            lists.sort(function (a, b) { return a.length - b.length; });
+            return show(lists.reduce(intersect), current);
+        }).catch(function () {
+            if (current === generation) results.textContent = '搜索索引加载失败';
+        });
+    }
+
+    var timer = null;
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () { search(input.value); }, 200);
+    });
+})();
+"""
+
+def render_search_box(search_base, pages_base):
+    """生成搜索框及搜索脚本
+
+    search_base为搜索索引目录的URL前缀，pages_base为结果链接中页面文件名的前缀。
+    """
+    config = json.dumps({
+        'base': search_base,
+        'pagesBase': pages_base,
+        'shards': SEARCH_SHARDS,
+        'docChunk': DOC_CHUNK_SIZE,
+    }, ensure_ascii=False).replace('</', '<\\/')
+    return f"""
+        <div class="search-box">
+            <input id="moments-search-input" type="search" placeholder="搜索朋友圈文字或链接…">
+            <div id="moments-search-results" class="search-results"></div>
+        </div>
+        <script id="moments-search-config" type="application/json">{config}</script>
+        <script>{SEARCH_SCRIPT}        </script>
+"""
+
+def format_duration(seconds):
+    """将时长格式化为m:ss或h:mm:ss"""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+def render_moment(moment, base_dir, thumbs=None, media_map=None):
+    """生成单条朋友圈的HTML片段，图片和视频路径相对于base_dir
+
+    thumbs为{原图路径: 缩略图路径}，有缩略图的图片显示缩略图并链接到原图。
+    media_map为{媒体或缩略图路径: 页面中使用的路径}（导出时使用），不在其中的文件仍使用相对路径。
+    """
+    formatted_date = moment.datetime.strftime('%Y年%m月%d日 %H:%M')
+    # 每条朋友圈只计算一次文件夹的相对路径，媒体文件名直接拼接
+    folder_path = moment.folder_path
+    folder_rel = os.path.relpath(folder_path, base_dir)
     
-    # 添加每条朋友圈
-    for moment in moments:
-        date_time = moment['datetime']
-        formatted_date = date_time.strftime('%Y年%m月%d日 %H:%M')
-        
-        html_content += f"""
-        <div class="moment">
+    parts = [f"""
+        <div class="moment" id="{moment_anchor(moment)}">
             <div class="moment-header">
                 <div class="moment-date">{html.escape(formatted_date)}</div>
-                <div class="moment-user">{html.escape(moment['user'])}</div>
+                <div class="moment-user">{html.escape(moment.user)}</div>
             </div>
+"""]
+    
+    # 添加文本内容
+    if moment.text:
+        parts.append(f'            <div class="moment-content">{html.escape(moment.text)}</div>\n')
+    
+    # 添加图片（已知尺寸时写出width/height，浏览器加载前即可预留位置；单张图片按原比例显示）
+    if moment.images:
+        sizes = moment.image_size_list()
+        single = len(moment.images) == 1 and sizes[0]
+        parts.append('            <div class="moment-images single">\n' if single
+                     else '            <div class="moment-images">\n')
+        for i, name in enumerate(moment.images):
+            rel_path = os.path.join(folder_rel, name)
+            if media_map:
+                rel_path = media_map.get(os.path.join(folder_path, name), rel_path)
+            thumb_path = thumbs.get(os.path.join(folder_path, name)) if thumbs else None
+            size_attrs = f' width="{sizes[i][0]}" height="{sizes[i][1]}"' if sizes[i] else ''
+            if thumb_path:
+                thumb_rel = media_map.get(thumb_path) if media_map else None
+                if thumb_rel is None:
+                    thumb_rel = os.path.relpath(thumb_path, base_dir)
+                parts.append(f'                <a href="{html.escape(rel_path)}" target="_blank">'
+                             f'<img src="{html.escape(thumb_rel)}"{size_attrs} alt="图片{i+1}" title="图片{i+1}" loading="lazy"></a>\n')
+            else:
+                parts.append(f'                <img src="{html.escape(rel_path)}"{size_attrs} alt="图片{i+1}" title="图片{i+1}">\n')
+        parts.append('            </div>\n')
+    
+    # 添加视频（不预加载；已知尺寸和时长时写出width/height和时长标记）
+    if moment.videos:
+        infos = moment.video_info or (None,) * len(moment.videos)
+        parts.append('            <div class="moment-videos">\n')
+        for i, name in enumerate(moment.videos):
+            rel_path = os.path.join(folder_rel, name)
+            if media_map:
+                rel_path = media_map.get(os.path.join(folder_path, name), rel_path)
+            rel_path = html.escape(rel_path)
+            mime, duration, width, height = infos[i] or ('video/mp4', None, None, None)
+            size_attrs = f' width="{width}" height="{height}"' if width and height else ''
+            parts.append('                <div class="video-item">\n')
+            parts.append(f'                    <video controls preload="none"{size_attrs}>\n')
+            parts.append(f'                        <source src="{rel_path}" type="{mime}">\n')
+            if mime == 'video/quicktime':
+                # 不支持QuickTime类型的浏览器（如Chrome）使用下一个source按MP4播放
+                parts.append(f'                        <source src="{rel_path}" type="video/mp4">\n')
+            parts.append('                        您的浏览器不支持视频播放。\n')
+            parts.append('                    </video>\n')
+            if duration:
+                parts.append(f'                    <span class="video-duration">{format_duration(duration)}</span>\n')
+            parts.append('                </div>\n')
+        parts.append('            </div>\n')
+    
+    # 添加链接
+    if moment.url:
+        parts.append('            <div class="moment-link">\n')
+        parts.append(f'                <a href="{html.escape(moment.url)}" target="_blank">{html.escape(moment.url)}</a>\n')
+        parts.append('            </div>\n')
+    
+    parts.append('        </div>\n')
+    return ''.join(parts)
+
+def _tmp_path(path):
+    """生成与目标文件同目录的临时文件路径（进程号+线程号，避免并发冲突）"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def fragment_cache_path_for(output_file):
+    """单页输出的片段缓存数据库的路径：与输出文件同名、扩展名为.fragments.sqlite3
+
+    分页输出的片段中媒体路径相对于分页目录，缓存在分页目录下（SHARD_FRAGMENT_CACHE_NAME），
+    同一输出文件在单页和分页输出之间切换时两者的缓存互不清除。
+    """
+    root, _ = os.path.splitext(output_file)
+    return f"{root}.fragments.sqlite3"
+
+def _fragment_key(moment, thumbs, root_rel):
+    """朋友圈片段的缓存键：由朋友圈根目录相对于页面的路径、文件夹名、
+    文件夹签名（内容变化时改变）和缩略图文件名计算"""
+    thumb_names = [os.path.basename(thumbs.get(p, '')) for p in moment.image_paths()] if thumbs else None
+    return hashlib.sha1(repr((root_rel, moment.folder, moment.signature, thumb_names))
+                        .encode('utf-8')).hexdigest()
+
+def _root_rel(moment, base_dir, cache):
+    """朋友圈根目录相对于base_dir的路径，按根目录缓存在cache中（同一根目录只计算一次）"""
+    root_rel = cache.get(moment.root)
+    if root_rel is None:
+        root_rel = cache[moment.root] = os.path.relpath(moment.root, base_dir)
+    return root_rel
+
+class FragmentCache:
+    """已渲染朋友圈片段的持久化缓存（SQLite数据库，每个片段一行）
+
+    片段按内容（文件夹签名）和朋友圈根目录的相对路径缓存，移动朋友圈目录后片段中的媒体路径
+    不会沿用旧位置；模板版本或媒体路径的基准目录变化时整个缓存失效。
+    重新生成时未变化的朋友圈直接使用缓存的片段，不再格式化日期、转义文本、计算相对路径。
+    片段在渲染时逐条读取，不把整个缓存载入内存；新渲染的片段每FRAGMENT_COMMIT_BATCH条
+    提交一次，两次提交之间不占用数据库的写锁，中途取消时已提交的片段仍可在下次使用。
+    render()可以在多个线程中同时调用。
+    """
+    
+    def __init__(self, cache_file, base_dir):
+        self.cache_file = cache_file
+        self.base_dir = base_dir
+        self.hits = self.misses = 0
+        self._used = set()
+        self._pending = []
+        self._root_rels = {}
+        self._lock = threading.Lock()
+        try:
+            self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+            self._conn.executescript(FRAGMENT_SCHEMA)
+            meta = dict(self._conn.execute('SELECT name, value FROM meta'))
+            expected = {'version': str(TEMPLATE_VERSION), 'base_dir': base_dir}
+            if meta != expected:
+                self._conn.execute('DELETE FROM fragments')
+                self._conn.execute('DELETE FROM meta')
+                self._conn.executemany('INSERT INTO meta (name, value) VALUES (?, ?)', expected.items())
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"打开片段缓存失败，本次不使用缓存: {e}")
+            self._conn = None
+        # 旧版本的JSON格式缓存文件已不再使用
+        try:
+            os.remove(f"{os.path.splitext(cache_file)[0]}.json")
+        except OSError:
+            pass
+    
+    def _key(self, moment, thumbs):
+        return _fragment_key(moment, thumbs, _root_rel(moment, self.base_dir, self._root_rels))
+    
+    def render(self, moment, thumbs=None):
+        """返回朋友圈的HTML片段，内容未变化时使用缓存"""
+        if self._conn is None:
+            return render_moment(moment, self.base_dir, thumbs)
+        key = self._key(moment, thumbs)
+        with self._lock:
+            row = self._conn.execute('SELECT html FROM fragments WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            fragment = row[0]
+        else:
+            fragment = render_moment(moment, self.base_dir, thumbs)
+        with self._lock:
+            if row is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._pending.append((key, fragment))
+                if len(self._pending) >= FRAGMENT_COMMIT_BATCH:
+                    self._flush()
+            self._used.add(key)
+        return fragment
+    
+    def _flush(self):
+        """写入并提交待保存的片段（调用时须持有self._lock），失败时丢弃这些片段"""
+        try:
+            self._conn.executemany('INSERT OR REPLACE INTO fragments (key, html) VALUES (?, ?)',
+                                   self._pending)
+            self._conn.commit()
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            print(f"写入片段缓存失败: {e}")
+        self._pending = []
+    
+    def keep(self, moments, thumbs=None):
+        """保留这些朋友圈的缓存片段（本次未重新渲染的分页使用）"""
+        for moment in moments:
+            self._used.add(self._key(moment, thumbs))
+    
+    def save(self, prune=True):
+        """提交本次新渲染的片段，然后关闭数据库
+
+        prune为True时删除本次未用到的片段。筛选输出时应传入False：未通过筛选的朋友圈没有渲染，
+        与增量缓存清单保留未通过筛选的条目一样保留它们的片段，取消筛选后仍可使用。
+        """
+        if self._conn is None:
+            return
+        try:
+            with self._lock:
+                self._flush()
+                if prune:
+                    stale = [(key,) for key, in self._conn.execute('SELECT key FROM fragments')
+                             if key not in self._used]
+                    self._conn.executemany('DELETE FROM fragments WHERE key = ?', stale)
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"写入片段缓存失败: {e}")
+        finally:
+            self._conn.close()
+            self._conn = None
+
+def write_html_stream(output_file, title, moments, base_dir, header="", footer="", thumbs=None,
+                      stats=None, progress=None, cancel_event=None, fragments=None, media_map=None):
+    """流式写入HTML页面
+
+    每条朋友圈渲染后立即写入带缓冲的临时文件，不在内存中拼接整页内容；
+    全部写完后原子地重命名为output_file，失败时保留原有文件不变。
+    header/footer为插入在朋友圈列表前后的额外HTML（如分页导航）。
+    stats为RunStats时分别累加渲染和写入的耗时。
+    fragments为base_dir对应的FragmentCache时使用其中缓存的朋友圈片段。
+    media_map见render_moment()，不能与fragments同时使用（缓存的片段使用相对路径）。
+    取消（GenerationCancelled）或出错时删除临时文件，原有页面保持不变。
+    """
+    render_seconds = 0.0
+    
+    def rendered():
+        nonlocal render_seconds
+        for done, moment in enumerate(moments):
+            _checkpoint(cancel_event, progress, 'render', done, len(moments))
+            render_start = time.perf_counter()
+            if fragments is not None:
+                fragment = fragments.render(moment, thumbs)
+            else:
+                fragment = render_moment(moment, base_dir, thumbs, media_map)
+            render_seconds += time.perf_counter() - render_start
+            yield fragment
+    
+    write_seconds = _write_page(output_file, title, rendered(), header, footer)
+    if stats:
+        stats.add_time('render', render_seconds)
+        stats.add_time('write', write_seconds)
+
+def render_progress_notice(count):
+    """生成部分页面末尾的提示：页面仍在生成中"""
+    return f"""
+        <div class="progress-notice">页面仍在生成中，已显示最新的 {count} 条朋友圈，<a href="">刷新页面</a>查看更多</div>
 """
-        
-        # 添加文本内容
-        if moment['content']['text']:
-            html_content += f'            <div class="moment-content">{html.escape(moment["content"]["text"])}</div>\n'
-        
-        # 添加图片
-        if moment['content']['images']:
-            html_content += '            <div class="moment-images">\n'
-            for i, img_path in enumerate(moment['content']['images']):
-                rel_path = os.path.relpath(img_path, MOMENTS_DIR)
-                html_content += f'                <img src="{html.escape(rel_path)}" alt="图片{i+1}" title="图片{i+1}">\n'
-            html_content += '            </div>\n'
-        
-        # 添加视频
-        if moment['content']['videos']:
-            html_content += '            <div class="moment-videos">\n'
-            for i, video_path in enumerate(moment['content']['videos']):
-                rel_path = os.path.relpath(video_path, MOMENTS_DIR)
-                html_content += f'                <video controls>\n'
-                html_content += f'                    <source src="{html.escape(rel_path)}" type="video/mp4">\n'
-                html_content += f'                    您的浏览器不支持视频播放。\n'
-                html_content += f'                </video>\n'
-            html_content += '            </div>\n'
-        
-        # 添加链接
-        if moment['content']['url']:
-            html_content += f'            <div class="moment-link">\n'
-            html_content += f'                <a href="{html.escape(moment["content"]["url"])}" target="_blank">{html.escape(moment["content"]["url"])}</a>\n'
-            html_content += '            </div>\n'
-        
-        html_content += '        </div>\n'
-    
-    html_content += """
-    </div>
-</body>
-</html>
+
+def _publish_partial(tmp_path, output_file, count):
+    """把已写入临时文件的部分加上提示和页面尾，原子地发布为output_file"""
+    partial_path = _tmp_path(f"{output_file}.partial")
+    try:
+        shutil.copyfile(tmp_path, partial_path)
+        with open(partial_path, 'a', encoding='utf-8') as f:
+            f.write(render_progress_notice(count))
+            f.write(PAGE_TAIL)
+        os.replace(partial_path, output_file)
+    except OSError as e:
+        print(f"写入部分页面失败: {e}")
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+
+def _write_page(output_file, title, fragments, header="", footer="", progressive=False):
+    """依次写入页面头、header、各朋友圈片段、footer和页面尾
+
+    写入带缓冲的临时文件，全部写完后原子地重命名为output_file；
+    fragments迭代中抛出异常（如取消）或写入失败时删除临时文件，原有页面保持不变。
+    progressive为True时，写入PROGRESSIVE_FIRST_BATCH条及之后每当条数翻倍时，
+    把已写入的部分发布为output_file（带有仍在生成中的提示），不必等整页写完就可以查看；
+    此时取消或出错会留下最后发布的部分页面。
+    返回写入文件的耗时（秒），不含等待fragments生成下一个片段的时间。
+    """
+    tmp_path = _tmp_path(output_file)
+    next_publish = PROGRESSIVE_FIRST_BATCH if progressive else None
+    try:
+        start = time.perf_counter()
+        with open(tmp_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(render_page_head(title))
+            f.write(header)
+            write_seconds = time.perf_counter() - start
+            for count, fragment in enumerate(fragments, 1):
+                start = time.perf_counter()
+                f.write(fragment)
+                if count == next_publish:
+                    f.flush()
+                    _publish_partial(tmp_path, output_file, count)
+                    next_publish *= 2
+                write_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            f.write(footer)
+            f.write(PAGE_TAIL)
+        os.replace(tmp_path, output_file)
+        return write_seconds + time.perf_counter() - start
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def shard_dir_for(output_file):
+    """分页模式下各分页所在的目录：与输出文件同名加_pages后缀"""
+    root, _ = os.path.splitext(output_file)
+    return f"{root}_pages"
+
+def _shard_key(moment, shard_by):
+    """朋友圈所属分页的键：按年为YYYY，按月为YYYY-MM"""
+    return _datetime_shard_key(moment.datetime, shard_by)
+
+def _datetime_shard_key(moment_datetime, shard_by):
+    """日期时间所属分页的键（可以只从文件夹名得到）"""
+    if shard_by == 'year':
+        return moment_datetime.strftime('%Y')
+    return moment_datetime.strftime('%Y-%m')
+
+def _shard_label(key):
+    """分页键的显示名称"""
+    if len(key) == 4:
+        return f"{key}年"
+    year, month = key.split('-')
+    return f"{year}年{month}月"
+
+def _shard_digest(title, key, prev_key, next_key, shard_dir, moments, thumbs, search):
+    """根据分页的全部输入计算摘要，摘要不变时分页内容也不变
+
+    每条朋友圈包含其根目录相对于分页目录的路径（合并多个目录时各不相同），
+    移动任一朋友圈目录后分页都会重新生成。
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps([TEMPLATE_VERSION, title, key, prev_key, next_key, search],
+                             ensure_ascii=False).encode('utf-8'))
+    root_rels = {}
+    for moment in moments:
+        thumb_names = [os.path.basename(thumbs.get(p, '')) for p in moment.image_paths()] if thumbs else None
+        digest.update(json.dumps([_root_rel(moment, shard_dir, root_rels), moment.folder,
+                                  moment.signature, thumb_names],
+                                 ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+def render_page_nav(prev_key, next_key, index_href):
+    """生成分页导航：较新一页、目录、较旧一页"""
+    newer = f'<a href="{html.escape(prev_key)}.html">← {html.escape(_shard_label(prev_key))}</a>' if prev_key else '<span></span>'
+    older = f'<a href="{html.escape(next_key)}.html">{html.escape(_shard_label(next_key))} →</a>' if next_key else '<span></span>'
+    return f"""
+        <div class="page-nav">
+            {newer}
+            <a href="{html.escape(index_href)}">目录</a>
+            {older}
+        </div>
 """
+
+def render_shard_index(title, shards, pages_href, header=""):
+    """生成分页目录页，按年份列出每个分页及其朋友圈数量"""
+    parts = [render_page_head(title), header, '        <div class="shard-index">\n']
+    for year, group in itertools.groupby(shards, key=lambda item: item[0][:4]):
+        parts.append(f'            <h2>{html.escape(year)}年</h2>\n            <ul>\n')
+        for key, count in group:
+            href = f"{pages_href}/{key}.html"
+            parts.append(f'                <li><a href="{html.escape(href)}">{html.escape(_shard_label(key))}</a>'
+                         f' <span class="count">({count})</span></li>\n')
+        parts.append('            </ul>\n')
+    parts.append('        </div>\n')
+    parts.append(PAGE_TAIL)
+    return ''.join(parts)
+
+def write_sharded_html(output_file, title, moments, shard_by, moments_dir, thumbs=None, search=False,
+                       stats=None, progress=None, cancel_event=None, use_fragments=True,
+                       prune_fragments=True):
+    """分页输出：每月或每年一个页面，output_file为分页目录页
+
+    moments需已按时间从新到旧排序。每个分页的输入摘要记录在分页状态文件中，
+    重新生成时只重写摘要发生变化的分页，并删除已不存在的分页。
+    search为True时每页包含搜索框（搜索索引由generate_html()另行写入）。
+    use_fragments为True时使用片段缓存，只渲染内容变化的朋友圈；
+    prune_fragments为False时（筛选输出）保留本次未用到的缓存片段，见FragmentCache.save()。
+    返回(重写的分页数, 跳过的分页数)。
+    """
+    groups = [(key, list(group)) for key, group in
+              itertools.groupby(moments, key=lambda m: _shard_key(m, shard_by))]
+    return _write_shard_pages(output_file, title, [(key, len(group)) for key, group in groups],
+                              (group for _, group in groups), moments_dir, thumbs, search,
+                              stats, progress, cancel_event, use_fragments,
+                              prune_fragments=prune_fragments)
+
+def _write_shard_pages(output_file, title, shards, pages, moments_dir, thumbs=None, search=False,
+                       stats=None, progress=None, cancel_event=None, use_fragments=True,
+                       index_first=False, prune_fragments=True):
+    """写入各分页及分页目录页，返回(重写的分页数, 跳过的分页数)
+
+    shards为按时间从新到旧排列的[(分页键, 朋友圈数)]，pages按相同顺序生成每个分页的朋友圈列表
+    （可以边读取边生成）。index_first为True时写完第一个分页后立即写入目录页，
+    之后的分页陆续写入（取消时保留已写入的分页）；否则重写的分页先写入临时文件，
+    全部写完后再依次替换分页、写入目录页和分页状态，取消或出错时原有分页保持不变。
+    """
+    shard_dir = shard_dir_for(output_file)
+    os.makedirs(shard_dir, exist_ok=True)
+    state_path = os.path.join(shard_dir, SHARD_STATE_NAME)
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            old_state = json.load(f)
+    except (OSError, ValueError):
+        old_state = {}
     
-    # 写入HTML文件
-    with open(HTML_FILE, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    index_href = os.path.relpath(output_file, shard_dir)
+    search_box = ""
+    if search:
+        search_box = render_search_box(_url_base(search_dir_for(output_file), shard_dir), "")
+    new_state = {}
+    written = skipped = 0
+    fragments = None
+    if use_fragments:
+        fragments = FragmentCache(os.path.join(shard_dir, SHARD_FRAGMENT_CACHE_NAME), shard_dir)
     
-    print(f"已生成HTML文件: {HTML_FILE}")
-    return HTML_FILE
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    pages_href = os.path.relpath(shard_dir, output_dir)
+    index_search_box = ""
+    if search:
+        index_search_box = render_search_box(_url_base(search_dir_for(output_file), output_dir),
+                                             _url_base(shard_dir, output_dir))
+    index_html = render_shard_index(title, shards, pages_href, header=index_search_box)
+    
+    staged = []  # [(临时文件, 分页文件)]
+    try:
+        for i, ((key, _), group) in enumerate(zip(shards, pages)):
+            _checkpoint(cancel_event, progress, 'render', i, len(shards))
+            prev_key = shards[i - 1][0] if i > 0 else None
+            next_key = shards[i + 1][0] if i + 1 < len(shards) else None
+            digest = _shard_digest(title, key, prev_key, next_key, shard_dir, group, thumbs, search)
+            new_state[key] = digest
+            page_path = os.path.join(shard_dir, f"{key}.html")
+            if old_state.get(key) == digest and os.path.exists(page_path):
+                if fragments is not None:
+                    fragments.keep(group, thumbs)
+                skipped += 1
+            else:
+                target = page_path if index_first else _tmp_path(page_path)
+                nav = render_page_nav(prev_key, next_key, index_href)
+                write_html_stream(target, f"{title} · {_shard_label(key)}", group, shard_dir,
+                                  header=nav + search_box, footer=nav, thumbs=thumbs, stats=stats,
+                                  cancel_event=cancel_event, fragments=fragments)
+                if target != page_path:
+                    staged.append((target, page_path))
+                written += 1
+            if index_first and i == 0:
+                # 最新的分页已可查看，先写目录页，其余分页陆续写入
+                _write_text_atomic(output_file, index_html)
+    except BaseException:
+        for tmp_path, _ in staged:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        raise
+    
+    for tmp_path, page_path in staged:
+        os.replace(tmp_path, page_path)
+    
+    if fragments is not None:
+        fragments.save(prune=prune_fragments)
+        if stats:
+            stats.incr('fragments_cached', fragments.hits)
+    
+    # 删除已经没有朋友圈的旧分页
+    for key in old_state:
+        if key not in new_state:
+            try:
+                os.remove(os.path.join(shard_dir, f"{key}.html"))
+            except OSError:
+                pass
+    
+    if not (index_first and shards):
+        _write_text_atomic(output_file, index_html)
+    _write_text_atomic(state_path, json.dumps(new_state, ensure_ascii=False))
+    return written, skipped
+
+def _write_text_atomic(path, text):
+    """原子地写入文本文件"""
+    tmp_path = _tmp_path(path)
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+# 虚拟滚动模式下每个数据分块包含的朋友圈条数
+VIRTUAL_CHUNK_SIZE = 100
+
+# 虚拟滚动脚本：按数据分块放置占位元素，只渲染视口附近的分块，
+# 离开视口的分块记录实际高度后清空，页面中的DOM数量与朋友圈总数无关。
+# 数据分块以<script>方式加载（而不是fetch），通过file://打开页面时同样可用。
+VIRTUAL_SCRIPT = """
+(function () {
+    var index = JSON.parse(document.getElementById('moments-index').textContent);
+    var timeline = document.getElementById('timeline');
+    var ESTIMATED_HEIGHT = 240;
+    var chunks = [];
+
+    function el(tag, className, text) {
+        var node = document.createElement(tag);
+        if (className) node.className = className;
+        if (text) node.textContent = text;
+        return node;
+    }
+
+    function formatDate(dt) {
+        var s = String(dt);
+        return s.slice(0, 4) + '年' + s.slice(4, 6) + '月' + s.slice(6, 8) + '日 ' +
+            s.slice(8, 10) + ':' + s.slice(10, 12);
+    }
+
+    function formatDuration(seconds) {
+        var total = Math.round(seconds);
+        var h = Math.floor(total / 3600), m = Math.floor(total % 3600 / 60), s = total % 60;
+        var pad = function (n) { return (n < 10 ? '0' : '') + n; };
+        return h ? h + ':' + pad(m) + ':' + pad(s) : m + ':' + pad(s);
+    }
+
+    function renderMoment(r, position) {
+        var moment = el('div', 'moment');
+        moment.id = 'p-' + position;
+        var header = el('div', 'moment-header');
+        header.appendChild(el('div', 'moment-date', formatDate(r[0])));
+        header.appendChild(el('div', 'moment-user', index.users[r[1]]));
+        moment.appendChild(header);
+        if (r[3]) moment.appendChild(el('div', 'moment-content', r[3]));
+
+        var base = index.mediaBase + r[2].split('/').map(encodeURIComponent).join('/') + '/';
+        if (r[5].length) {
+            var single = r[5].length === 1 && r[8][0];
+            var images = el('div', single ? 'moment-images single' : 'moment-images');
+            r[5].forEach(function (name, k) {
+                var img = el('img');
+                img.loading = 'lazy';
+                img.alt = img.title = '图片' + (k + 1);
+                if (r[8][k]) {
+                    img.width = r[8][k][0];
+                    img.height = r[8][k][1];
+                }
+                var thumb = r[7][k];
+                if (thumb) {
+                    var link = el('a');
+                    link.href = base + encodeURIComponent(name);
+                    link.target = '_blank';
+                    img.src = index.thumbBase + thumb;
+                    link.appendChild(img);
+                    images.appendChild(link);
+                } else {
+                    img.src = base + encodeURIComponent(name);
+                    images.appendChild(img);
+                }
+            });
+            moment.appendChild(images);
+        }
+
+        if (r[6].length) {
+            var videos = el('div', 'moment-videos');
+            r[6].forEach(function (name, k) {
+                var info = r[9][k] || ['video/mp4', null, null, null];
+                var item = el('div', 'video-item');
+                var video = el('video');
+                video.controls = true;
+                video.preload = 'none';
+                if (info[2] && info[3]) {
+                    video.width = info[2];
+                    video.height = info[3];
+                }
+                var types = info[0] === 'video/quicktime' ? [info[0], 'video/mp4'] : [info[0]];
+                types.forEach(function (type) {
+                    var source = el('source');
+                    source.src = base + encodeURIComponent(name);
+                    source.type = type;
+                    video.appendChild(source);
+                });
+                item.appendChild(video);
+                if (info[1]) item.appendChild(el('span', 'video-duration', formatDuration(info[1])));
+                videos.appendChild(item);
+            });
+            moment.appendChild(videos);
+        }
+
+        if (r[4]) {
+            var linkBox = el('div', 'moment-link');
+            var a = el('a', null, r[4]);
+            a.href = r[4];
+            a.target = '_blank';
+            linkBox.appendChild(a);
+            moment.appendChild(linkBox);
+        }
+        return moment;
+    }
+
+    function render(chunk) {
+        if (chunk.rendered || !chunk.records) return;
+        var fragment = document.createDocumentFragment();
+        chunk.records.forEach(function (r, k) {
+            fragment.appendChild(renderMoment(r, chunk.index * index.chunkSize + k));
+        });
+        chunk.node.style.height = '';
+        chunk.node.appendChild(fragment);
+        chunk.rendered = true;
+    }
+
+    function release(chunk) {
+        if (!chunk.rendered) return;
+        chunk.node.style.height = chunk.node.offsetHeight + 'px';
+        chunk.node.textContent = '';
+        chunk.rendered = false;
+    }
+
+    function load(chunk) {
+        if (chunk.records) {
+            render(chunk);
+            return;
+        }
+        if (chunk.loading) return;
+        chunk.loading = true;
+        var script = document.createElement('script');
+        script.src = index.dataBase + 'chunk-' + index.version + '-' + chunk.index + '.js';
+        script.onload = script.onerror = function () { script.remove(); };
+        document.head.appendChild(script);
+    }
+
+    window.__momentsChunk = function (i, records) {
+        var chunk = chunks[i];
+        chunk.records = records;
+        chunk.loading = false;
+        if (chunk.visible) render(chunk);
+        if (chunk.onrender) chunk.onrender();
+    };
+
+    // 跳转到第position条朋友圈（供页面搜索使用）：先滚动到所在分块，渲染后再定位
+    window.__momentsReveal = function (position, anchor) {
+        var chunk = chunks[Math.floor(position / index.chunkSize)];
+        function scrollToMoment() {
+            chunk.onrender = null;
+            render(chunk);
+            document.getElementById(anchor).scrollIntoView();
+        }
+        chunk.node.scrollIntoView();
+        if (chunk.records) scrollToMoment();
+        else {
+            chunk.onrender = scrollToMoment;
+            load(chunk);
+        }
+    };
+
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            var chunk = chunks[entry.target.dataset.index];
+            chunk.visible = entry.isIntersecting;
+            if (entry.isIntersecting) load(chunk); else release(chunk);
+        });
+    }, {rootMargin: '1500px 0px'});
+
+    for (var i = 0; i < index.chunks; i++) {
+        var size = Math.min(index.chunkSize, index.count - i * index.chunkSize);
+        var node = el('section', 'chunk');
+        node.dataset.index = i;
+        node.style.height = size * ESTIMATED_HEIGHT + 'px';
+        timeline.appendChild(node);
+        chunks.push({index: i, node: node});
+        observer.observe(node);
+    }
+})();
+"""
+
+def data_dir_for(output_file):
+    """虚拟滚动模式下数据分块所在的目录：与输出文件同名加_data后缀"""
+    root, _ = os.path.splitext(output_file)
+    return f"{root}_data"
+
+def _url_base(path, start):
+    """path相对于start的URL前缀（以/结尾，同一目录时为空字符串）"""
+    rel_path = os.path.relpath(path, start)
+    if rel_path == '.':
+        return ''
+    return urllib.parse.quote(rel_path.replace(os.sep, '/')) + '/'
+
+def _moment_record(moment, users, thumbs, moments_dir):
+    """将朋友圈转换为紧凑的JSON记录
+
+    [日期时间YYYYMMDDHHMM, 用户序号, 文件夹名, 文本, 链接, 图片文件名, 视频文件名, 缩略图文件名,
+     图片尺寸[宽, 高]（未知时为0）, 视频信息[MIME类型, 时长, 宽, 高]（未知时为0）]
+    朋友圈不在moments_dir中（合并其他目录）时，文件夹名为相对于moments_dir的路径（以/分隔）。
+    """
+    user_index = users.setdefault(moment.user, len(users))
+    folder = moment.folder
+    if moment.root != moments_dir:
+        folder = os.path.relpath(moment.folder_path, moments_dir).replace(os.sep, '/')
+    thumb_names = []
+    if thumbs:
+        thumb_names = [os.path.basename(thumbs[p]) if p in thumbs else ''
+                       for p in moment.image_paths()]
+    return [
+        int(moment.datetime.strftime('%Y%m%d%H%M')),
+        user_index,
+        folder,
+        moment.text,
+        moment.url,
+        moment.images,
+        moment.videos,
+        thumb_names,
+        [size or 0 for size in moment.image_size_list()],
+        [info or 0 for info in moment.video_info or (None,) * len(moment.videos)],
+    ]
+
+def write_virtual_html(output_file, title, moments, moments_dir, thumbs=None,
+                       chunk_size=VIRTUAL_CHUNK_SIZE, search=False, stats=None,
+                       progress=None, cancel_event=None):
+    """虚拟滚动输出：朋友圈数据写入分块数据文件，页面只包含占位和渲染脚本
+
+    moments需已按时间从新到旧排序。search为True时页面包含搜索框。返回写入的数据分块数。
+    数据分块先写入临时文件，全部写完后重命名为带版本号的文件名（chunk-<版本>-<序号>.js）并替换页面，
+    最后删除旧版本的分块：取消或出错时已有的页面及其引用的分块保持不变。
+    """
+    data_dir = data_dir_for(output_file)
+    os.makedirs(data_dir, exist_ok=True)
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    users = {}
+    version = hashlib.sha1()
+    chunk_count = 0
+    
+    stats = stats or RunStats()
+    tmp_paths = []
+    try:
+        for start in range(0, len(moments), chunk_size):
+            _checkpoint(cancel_event, progress, 'render', start, len(moments))
+            with stats.stage('render'):
+                records = [_moment_record(m, users, thumbs, moments_dir)
+                           for m in moments[start:start + chunk_size]]
+                payload = json.dumps(records, ensure_ascii=False, separators=(',', ':'))
+                version.update(payload.encode('utf-8'))
+            with stats.stage('write'):
+                tmp_paths.append(_tmp_path(os.path.join(data_dir, f"chunk-{chunk_count}.js")))
+                with open(tmp_paths[-1], 'w', encoding='utf-8') as f:
+                    f.write(f"window.__momentsChunk({chunk_count},{payload});\n")
+            chunk_count += 1
+    except BaseException:
+        for tmp_path in tmp_paths:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        raise
+    
+    version_key = version.hexdigest()[:12]
+    for i, tmp_path in enumerate(tmp_paths):
+        os.replace(tmp_path, os.path.join(data_dir, f"chunk-{version_key}-{i}.js"))
+    
+    index = {
+        'version': version_key,
+        'count': len(moments),
+        'chunkSize': chunk_size,
+        'chunks': chunk_count,
+        'users': list(users),
+        'dataBase': _url_base(data_dir, output_dir),
+        'mediaBase': _url_base(moments_dir, output_dir),
+        'thumbBase': _url_base(os.path.join(moments_dir, THUMB_DIR_NAME), output_dir),
+    }
+    index_json = json.dumps(index, ensure_ascii=False).replace('</', '<\\/')
+    search_box = render_search_box(_url_base(search_dir_for(output_file), output_dir), "") if search else ""
+    page = (render_page_head(title)
+            + search_box
+            + '        <div id="timeline"></div>\n'
+            + f'        <script id="moments-index" type="application/json">{index_json}</script>\n'
+            + f'        <script>{VIRTUAL_SCRIPT}        </script>\n'
+            + PAGE_TAIL)
+    _write_text_atomic(output_file, page)
+    
+    # 页面已引用新版本的分块，删除旧版本（及旧格式chunk-<序号>.js）的分块
+    for name in os.listdir(data_dir):
+        match = re.fullmatch(r'chunk-(?:([0-9a-f]{12})-)?[0-9]+\.js', name)
+        if match and match.group(1) != version_key:
+            try:
+                os.remove(os.path.join(data_dir, name))
+            except OSError:
+                pass
+    return chunk_count
+
+def report_path_for(output_file):
+    """运行报告的路径：与输出文件同名、扩展名为.report.json"""
+    root, _ = os.path.splitext(output_file)
+    return f"{root}.report.json"
+
+# 正在写入的输出文件 -> 锁，同一进程内写同一输出文件的生成任务依次进行
+_OUTPUT_LOCKS = {}
+_OUTPUT_LOCKS_GUARD = threading.Lock()
+
+def _title_from_folders(folders):
+    """页面标题：最新一条朋友圈的用户名（只从按时间从新到旧排列的文件夹名得到）"""
+    for folder in folders:
+        if extract_datetime(folder):
+            return f"{get_user_name(folder)}朋友圈"
+    return "朋友圈时间线"  # 默认标题
+
+def _output_lock(output_file):
+    """返回输出文件对应的锁"""
+    key = os.path.normcase(os.path.realpath(output_file))
+    with _OUTPUT_LOCKS_GUARD:
+        return _OUTPUT_LOCKS.setdefault(key, threading.Lock())
+
+class MomentsGenerator:
+    """按配置生成一个朋友圈目录的HTML时间线
+
+    目录、输出文件和选项都保存在实例中，不读取也不修改模块全局变量，
+    不同实例可以在多个线程或多个进程中同时运行；实例只包含普通属性，可以传给子进程。
+    同一进程内写同一输出文件的生成任务会依次进行，输出文件总是原子替换。
+
+    use_cache为False时忽略增量缓存清单和片段缓存，重新读取并渲染所有朋友圈。
+    workers为扫描文件夹时的并发线程数，1表示顺序扫描。
+    shard_by为'month'或'year'时按月/按年分页输出，output_file为分页目录页。
+    thumbnails为True时生成缩略图，页面显示缩略图并链接到原图（需要Pillow）。
+    virtual为True时朋友圈数据写入分块数据文件，页面按视口虚拟滚动渲染。
+    use_index为True时从SQLite索引读取朋友圈（refresh_index为False时不刷新索引、不遍历目录）。
+    search为True时建立全文搜索索引，页面中包含搜索框。
+    since/until（date，包含两端）和users（用户名集合）只按文件夹名筛选朋友圈，
+    被排除的文件夹不读取任何文件。
+    pipeline为True时，单页输出（不分页、不使用虚拟滚动、缩略图和索引）按流水线生成：
+    按文件夹名排好顺序后，读取（workers个线程）、渲染（render_workers个线程）和写入同时进行。
+    progressive为True时渐进式生成：单页输出在写入最新的一批朋友圈后即发布部分页面，
+    分页输出从最新的分页开始逐页读取并写入，写完第一页即写入目录页（不支持虚拟滚动、缩略图和索引）。
+    merge_roots为要与moments_dir合并的其他朋友圈目录，合并后按发布时间和内容哈希去重，
+    生成一条时间线（不能与索引或渐进式生成同时使用）。
+    """
+    
+    def __init__(self, moments_dir, output_file=None, use_cache=True, workers=SCAN_WORKERS,
+                 shard_by=None, thumbnails=False, virtual=False, use_index=False,
+                 refresh_index=True, search=False, since=None, until=None, users=None,
+                 pipeline=True, render_workers=RENDER_WORKERS, progressive=False,
+                 merge_roots=None):
+        if shard_by and shard_by not in SHARD_MODES:
+            raise ValueError(f"不支持的分页方式: {shard_by}")
+        if shard_by and virtual:
+            raise ValueError("分页输出与虚拟滚动输出不能同时使用")
+        if progressive and (virtual or thumbnails or use_index):
+            raise ValueError("渐进式生成不能与虚拟滚动、缩略图或索引同时使用")
+        if merge_roots and (use_index or progressive):
+            raise ValueError("合并多个目录时不能使用索引或渐进式生成")
+        self.moments_dir = moments_dir
+        self.output_file = output_file or os.path.join(moments_dir, DEFAULT_HTML_NAME)
+        self.use_cache = use_cache
+        self.workers = workers
+        self.shard_by = shard_by
+        self.thumbnails = thumbnails
+        self.virtual = virtual
+        self.use_index = use_index
+        self.refresh_index = refresh_index
+        self.search = search
+        self.pipeline = pipeline
+        self.render_workers = render_workers
+        self.progressive = progressive
+        self.merge_roots = list(merge_roots or ())
+        self.folder_filter = None
+        if since or until or users:
+            self.folder_filter = MomentFilter(since, until, users)
+    
+    def options(self):
+        """生成选项（写入运行报告）"""
+        return {
+            'use_cache': self.use_cache, 'workers': self.workers, 'shard_by': self.shard_by,
+            'thumbnails': self.thumbnails, 'virtual': self.virtual, 'use_index': self.use_index,
+            'search': self.search, 'pipeline': self.uses_pipeline(),
+            'render_workers': self.render_workers, 'progressive': self.progressive,
+            'merge_roots': self.merge_roots,
+            'filter': self.folder_filter.to_dict() if self.folder_filter else None,
+        }
+    
+    def uses_pipeline(self):
+        """本次生成是否按流水线进行（只用于单页输出，渐进式生成总是使用流水线）"""
+        return (self.pipeline or self.progressive) and not (self.shard_by or self.virtual
+                                                            or self.thumbnails or self.use_index
+                                                            or self.merge_roots)
+    
+    def generate(self, changed_folders=None, stats=None, progress=None, cancel_event=None):
+        """生成HTML文档，返回输出文件路径
+
+        changed_folders为已知发生变化的文件夹名集合，只重新检查这些文件夹（监视模式使用）。
+        stats为RunStats时记录各阶段耗时和计数；运行报告写入与HTML文件同名的.report.json文件。
+        progress为进度回调progress(stage, done, total)；cancel_event为threading.Event，
+        被设置后尽快停止并抛出GenerationCancelled，已有的输出文件保持不变
+        （渐进式输出除外：取消时保留已经发布的部分）。
+        """
+        with _output_lock(self.output_file):
+            return self._generate(changed_folders, stats if stats is not None else RunStats(),
+                                  progress, cancel_event)
+    
+    def load_moments(self, changed_folders=None, stats=None, progress=None, cancel_event=None,
+                     save_cache=True):
+        """按选项读取（并筛选）朋友圈，按时间从新到旧排序，返回Moment列表
+
+        save_cache为False时不写回朋友圈根目录中的增量缓存清单（见collect_moments()）。
+        """
+        if stats is None:
+            stats = RunStats()
+        if self.use_index:
+            from moments_index import MomentsIndex
+            with MomentsIndex(self.moments_dir) as index:
+                if self.refresh_index:
+                    _checkpoint(cancel_event, progress, 'scan')
+                    with stats.stage('scan'):
+                        updated, removed, unchanged = index.refresh(workers=self.workers)
+                    print(f"索引已刷新：更新 {updated} 个，删除 {removed} 个，未变化 {unchanged} 个文件夹")
+                # 索引查询结果已按时间从新到旧排序
+                with stats.stage('parse'):
+                    folder_filter = self.folder_filter
+                    if folder_filter is None:
+                        moments = list(index.query())
+                    else:
+                        moments = [moment for moment in
+                                   index.query(folder_filter.start, folder_filter.end)
+                                   if folder_filter(moment.folder)]
+            stats.incr('folders_accepted', len(moments))
+            return moments
+        
+        if self.merge_roots:
+            from merge_archives import merge_moments, hash_cache_path_for
+            # 合并结果已按时间从新到旧排序
+            return merge_moments([self.moments_dir] + self.merge_roots,
+                                 hash_cache_path_for(self.output_file), use_cache=self.use_cache,
+                                 workers=self.workers, stats=stats, progress=progress,
+                                 cancel_event=cancel_event, folder_filter=self.folder_filter,
+                                 save_cache=save_cache)
+        
+        moments = collect_moments(self.moments_dir, use_cache=self.use_cache, workers=self.workers,
+                                  changed_folders=changed_folders, stats=stats,
+                                  progress=progress, cancel_event=cancel_event,
+                                  folder_filter=self.folder_filter, save_cache=save_cache)
+        
+        # 按时间排序（从新到旧），时间相同时按文件夹名排序以保证输出稳定：
+        # 列表已按文件夹名排序，先反转再按整数时间戳做稳定排序即可，不需要构造元组键
+        with stats.stage('sort'):
+            moments.reverse()
+            moments.sort(key=MOMENT_SORT_KEY, reverse=True)
+        return moments
+    
+    def _generate_pipelined(self, changed_folders, stats, progress, cancel_event):
+        """按流水线生成单页输出，返回按时间从新到旧排列的朋友圈
+
+        文件夹名中包含时间，只列一次目录即可排好最终顺序；之后按顺序分块，
+        读取、渲染、写入三个阶段同时进行，写入线程按顺序把片段写入临时文件。
+        
+        运行报告中pipeline为整个流水线的耗时；parse和render为各线程执行时间之和
+        （线程秒，多线程时可能超过pipeline），write为写入线程写文件的耗时。
+        """
+        moments_dir, output_file = self.moments_dir, self.output_file
+        _checkpoint(cancel_event, progress, 'scan')
+        with stats.stage('scan'):
+            folders, manifest, new_manifest = _scan_folders(moments_dir, self.use_cache,
+                                                            self.folder_filter, stats)
+            folders.sort(key=folder_sort_key, reverse=True)
+        
+        user_title = _title_from_folders(folders)
+        base_dir = os.path.dirname(os.path.abspath(output_file))
+        header = ""
+        if self.search:
+            header = render_search_box(_url_base(search_dir_for(output_file), base_dir), "")
+        fragments = None
+        if self.use_cache:
+            fragments = FragmentCache(fragment_cache_path_for(output_file), base_dir)
+        
+        def load_chunk(chunk):
+            _checkpoint(cancel_event)
+            return [_load_folder(moments_dir, folder, manifest, changed_folders, stats)
+                    for folder in chunk]
+        
+        def render_chunk(results):
+            _checkpoint(cancel_event)
+            rendered = []
+            for moment, _, _ in results:
+                if moment is not None:
+                    rendered.append(fragments.render(moment) if fragments is not None
+                                    else render_moment(moment, base_dir))
+            return results, rendered
+        
+        moments = []
+        reused = 0
+        
+        def ordered_fragments(results):
+            nonlocal reused
+            for chunk_results, rendered in results:
+                for moment, entry, hit in chunk_results:
+                    if moment is None:
+                        continue
+                    new_manifest[moment.folder] = entry
+                    moments.append(moment)
+                    if hit:
+                        reused += 1
+                yield from rendered
+                _checkpoint(cancel_event, progress, 'render', len(moments), len(folders))
+        
+        chunks = [folders[i:i + PIPELINE_CHUNK_SIZE]
+                  for i in range(0, len(folders), PIPELINE_CHUNK_SIZE)]
+        stages = [('parse', load_chunk, self.workers), ('render', render_chunk, self.render_workers)]
+        with stats.stage('pipeline'), Pipeline(stages) as pipeline:
+            write_seconds = _write_page(output_file, user_title,
+                                        ordered_fragments(pipeline.run(chunks)), header,
+                                        progressive=self.progressive)
+        for name, seconds in pipeline.busy_seconds.items():
+            stats.add_time(name, seconds)
+        stats.add_time('write', write_seconds)
+        
+        stats.incr('folders_accepted', len(moments))
+        stats.incr('cache_hits', reused)
+        if self.use_cache:
+            save_manifest(moments_dir, new_manifest)
+            print(f"缓存命中 {reused} 个文件夹，重新读取 {len(moments) - reused} 个文件夹")
+        if fragments is not None:
+            fragments.save(prune=self.folder_filter is None)
+            stats.incr('fragments_cached', fragments.hits)
+        return moments
+    
+    def _generate_progressive_shards(self, changed_folders, stats, progress, cancel_event):
+        """渐进式分页输出：从最新的分页开始，逐页读取文件夹并写入分页，返回全部朋友圈
+
+        分页的划分和每页的朋友圈数量只从文件夹名得到，写完最新的分页后即写入目录页；
+        读取后面分页的文件夹与写入前面的分页同时进行。
+        """
+        moments_dir, shard_by = self.moments_dir, self.shard_by
+        _checkpoint(cancel_event, progress, 'scan')
+        with stats.stage('scan'):
+            folders, manifest, new_manifest = _scan_folders(moments_dir, self.use_cache,
+                                                            self.folder_filter, stats)
+            folders.sort(key=folder_sort_key, reverse=True)
+            dated = [(folder, extract_datetime(folder)) for folder in folders]
+            # 日期无效的文件夹排在最后，读取时会被跳过
+            stats.incr('folders_skipped', sum(1 for _, moment_datetime in dated
+                                              if moment_datetime is None))
+            groups = [(key, [folder for folder, _ in group]) for key, group in itertools.groupby(
+                (item for item in dated if item[1] is not None),
+                key=lambda item: _datetime_shard_key(item[1], shard_by))]
+        
+        def load_group(group):
+            _checkpoint(cancel_event)
+            return [_load_folder(moments_dir, folder, manifest, changed_folders, stats)
+                    for folder in group]
+        
+        moments = []
+        reused = 0
+        
+        def pages(results):
+            nonlocal reused
+            for group_results in results:
+                page = []
+                for moment, entry, hit in group_results:
+                    new_manifest[moment.folder] = entry
+                    page.append(moment)
+                    if hit:
+                        reused += 1
+                moments.extend(page)
+                yield page
+        
+        user_title = _title_from_folders(folders)
+        with stats.stage('pipeline'), Pipeline([('parse', load_group, self.workers)]) as pipeline:
+            written, skipped = _write_shard_pages(
+                self.output_file, user_title, [(key, len(group)) for key, group in groups],
+                pages(pipeline.run([group for _, group in groups])), moments_dir,
+                search=self.search, stats=stats, progress=progress, cancel_event=cancel_event,
+                use_fragments=self.use_cache, index_first=True,
+                prune_fragments=self.folder_filter is None)
+        stats.add_time('parse', pipeline.busy_seconds['parse'])
+        print(f"已写入 {written} 个分页，跳过未变化的 {skipped} 个分页")
+        
+        stats.incr('folders_accepted', len(moments))
+        stats.incr('cache_hits', reused)
+        if self.use_cache:
+            save_manifest(moments_dir, new_manifest)
+            print(f"缓存命中 {reused} 个文件夹，重新读取 {len(moments) - reused} 个文件夹")
+        return moments
+    
+    def _generate(self, changed_folders, stats, progress, cancel_event):
+        moments_dir, output_file = self.moments_dir, self.output_file
+        shard_by, virtual, search = self.shard_by, self.virtual, self.search
+        pipelined = self.uses_pipeline()
+        progressive_shards = self.progressive and shard_by
+        if pipelined:
+            moments = self._generate_pipelined(changed_folders, stats, progress, cancel_event)
+        elif progressive_shards:
+            moments = self._generate_progressive_shards(changed_folders, stats, progress, cancel_event)
+        else:
+            moments = self.load_moments(changed_folders, stats, progress, cancel_event)
+        
+        stats.incr('images', sum(len(m.images) for m in moments))
+        stats.incr('videos', sum(len(m.videos) for m in moments))
+        
+        # 获取用户名用于标题
+        user_title = "朋友圈时间线"  # 默认标题
+        if moments:
+            user_title = f"{moments[0].user}朋友圈"
+        
+        thumbs = None
+        if self.thumbnails:
+            image_paths = [path for moment in moments for path in moment.image_paths()]
+            with stats.stage('thumbnails'):
+                thumbs = build_thumbnails(
+                    moments_dir, image_paths, cancel_event=cancel_event,
+                    progress=progress and (lambda done, total: progress('thumbnails', done, total)),
+                    prune=self.folder_filter is None)
+            _checkpoint(cancel_event)
+        
+        # 流水线和渐进式分页输出已在读取的同时写入页面
+        if shard_by and not progressive_shards:
+            written, skipped = write_sharded_html(output_file, user_title, moments, shard_by, moments_dir,
+                                                  thumbs, search=search, stats=stats,
+                                                  progress=progress, cancel_event=cancel_event,
+                                                  use_fragments=self.use_cache,
+                                                  prune_fragments=self.folder_filter is None)
+            print(f"已写入 {written} 个分页，跳过未变化的 {skipped} 个分页")
+        elif virtual:
+            chunk_count = write_virtual_html(output_file, user_title, moments, moments_dir, thumbs,
+                                             search=search, stats=stats,
+                                             progress=progress, cancel_event=cancel_event)
+            print(f"已写入 {chunk_count} 个数据分块")
+        elif not (pipelined or shard_by):
+            # 流式写入HTML，媒体路径相对于输出文件所在目录
+            base_dir = os.path.dirname(os.path.abspath(output_file))
+            header = ""
+            if search:
+                header = render_search_box(_url_base(search_dir_for(output_file), base_dir), "")
+            fragments = None
+            if self.use_cache:
+                fragments = FragmentCache(fragment_cache_path_for(output_file), base_dir)
+            write_html_stream(output_file, user_title, moments, base_dir, header=header, thumbs=thumbs,
+                              stats=stats, progress=progress, cancel_event=cancel_event,
+                              fragments=fragments)
+            if fragments is not None:
+                fragments.save(prune=self.folder_filter is None)
+                stats.incr('fragments_cached', fragments.hits)
+        
+        if search:
+            _checkpoint(cancel_event, progress, 'search')
+            if shard_by:
+                entries = [(m, f"{_shard_key(m, shard_by)}.html", moment_anchor(m)) for m in moments]
+            elif virtual:
+                entries = [(m, "", f"p-{i}") for i, m in enumerate(moments)]
+            else:
+                entries = [(m, "", moment_anchor(m)) for m in moments]
+            with stats.stage('search'):
+                token_count, written_files = write_search_index(output_file, entries)
+            print(f"搜索索引包含 {token_count} 个词项，更新了 {written_files} 个索引文件")
+        
+        stats.finish()
+        report_file = report_path_for(output_file)
+        try:
+            stats.write_report(report_file, moments_dir=moments_dir, output_file=output_file,
+                               options=dict(self.options(), changed_folders=None
+                                            if changed_folders is None else len(changed_folders)))
+        except OSError as e:
+            print(f"写入运行报告失败: {e}")
+        
+        print(f"已生成HTML文件: {output_file}")
+        for line in stats.summary_lines():
+            print(line)
+        return output_file
+
+def generate_html(use_cache=True, workers=SCAN_WORKERS, shard_by=None, thumbnails=False,
+                  virtual=False, use_index=False, refresh_index=True, search=False,
+                  changed_folders=None, stats=None, progress=None, cancel_event=None):
+    """直接生成HTML文档（使用模块中的MOMENTS_DIR和HTML_FILE）
+
+    选项含义见MomentsGenerator；需要同时生成多个目录时请直接使用MomentsGenerator。
+    """
+    generator = MomentsGenerator(MOMENTS_DIR, HTML_FILE, use_cache=use_cache, workers=workers,
+                                 shard_by=shard_by, thumbnails=thumbnails, virtual=virtual,
+                                 use_index=use_index, refresh_index=refresh_index, search=search)
+    return generator.generate(changed_folders=changed_folders, stats=stats,
+                              progress=progress, cancel_event=cancel_event)
 
 
 
 def main():
     """主函数"""
-    generate_html()
+    parser = argparse.ArgumentParser(description="生成朋友圈HTML时间线")
+    parser.add_argument('--moments-dir', default=MOMENTS_DIR,
+                        help="朋友圈根目录（默认: %(default)s）")
+    parser.add_argument('--merge', action='append', dest='merge_roots', metavar='DIR',
+                        help="与朋友圈根目录合并的其他备份目录（按发布时间和内容去重），可重复指定")
+    parser.add_argument('--output',
+                        help="输出HTML文件路径（默认: 朋友圈根目录下的%s）" % DEFAULT_HTML_NAME)
+    parser.add_argument('--workers', type=int, default=SCAN_WORKERS,
+                        help="扫描文件夹的并发线程数，网络存储上可适当调大（默认: %(default)s）")
+    parser.add_argument('--render-workers', type=int, default=RENDER_WORKERS,
+                        help="流水线模式下渲染朋友圈的线程数（默认: %(default)s）")
+    parser.add_argument('--no-pipeline', action='store_true',
+                        help="不使用流水线，依次完成扫描、排序、渲染和写入")
+    parser.add_argument('--progressive', action='store_true',
+                        help="渐进式生成：先写出最新的朋友圈（或最新的分页），其余部分陆续写入")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="忽略增量缓存清单，重新读取所有文件夹")
+    parser.add_argument('--shard', choices=SHARD_MODES,
+                        help="按月(month)或按年(year)分页输出，输出文件为分页目录页")
+    parser.add_argument('--thumbnails', action='store_true',
+                        help="生成缩略图，页面显示缩略图并链接到原图（需要Pillow）")
+    parser.add_argument('--virtual', action='store_true',
+                        help="输出分块数据文件和虚拟滚动页面，适合超大归档")
+    parser.add_argument('--index', action='store_true',
+                        help="刷新SQLite索引并从索引读取朋友圈")
+    parser.add_argument('--index-only', action='store_true',
+                        help="直接从现有SQLite索引读取朋友圈，不遍历目录")
+    parser.add_argument('--search', action='store_true',
+                        help="建立全文搜索索引，页面中包含搜索框")
+    parser.add_argument('--since', type=parse_date, metavar='YYYY-MM-DD',
+                        help="只生成该日期及之后的朋友圈（按文件夹名筛选，不读取被排除的文件夹）")
+    parser.add_argument('--until', type=parse_date, metavar='YYYY-MM-DD',
+                        help="只生成该日期及之前的朋友圈")
+    parser.add_argument('--days', type=int,
+                        help="只生成最近N天的朋友圈（与--since同时使用时以较晚者为准）")
+    parser.add_argument('--user', action='append', dest='users', metavar='NAME',
+                        help="只生成该用户的朋友圈，可重复指定")
+    parser.add_argument('--watch', action='store_true',
+                        help="生成后持续监视朋友圈目录，有变化时自动重新生成（Ctrl+C退出）")
+    parser.add_argument('--export', metavar='DEST',
+                        help="导出包含页面和媒体文件的离线包到DEST目录（以.zip结尾时导出为zip文件），"
+                             "不写入朋友圈根目录中的输出文件")
+    args = parser.parse_args()
+    if args.export and (args.shard or args.virtual or args.watch):
+        parser.error("--export不能与--shard、--virtual或--watch同时使用")
+    
+    since = args.since
+    if args.days is not None:
+        recent = datetime.date.today() - datetime.timedelta(days=args.days - 1)
+        since = max(since, recent) if since else recent
+    try:
+        generator = MomentsGenerator(args.moments_dir, args.output, use_cache=not args.no_cache,
+                                     workers=args.workers, shard_by=args.shard,
+                                     thumbnails=args.thumbnails, virtual=args.virtual,
+                                     use_index=args.index or args.index_only,
+                                     refresh_index=not args.index_only, search=args.search,
+                                     since=since, until=args.until, users=args.users,
+                                     pipeline=not args.no_pipeline,
+                                     render_workers=args.render_workers,
+                                     progressive=args.progressive,
+                                     merge_roots=args.merge_roots)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.export:
+        from export_bundle import export_bundle
+        export_bundle(generator, args.export)
+        return
+    generator.generate()
+    
+    if args.watch:
+        from watcher import watch
+        
+        def regenerate(folders):
+            if folders is None:
+                print("检测到目录变化，重新检查全部文件夹...")
+            else:
+                print(f"检测到 {len(folders)} 个文件夹变化，重新生成...")
+            try:
+                generator.generate(changed_folders=folders)
+            except Exception as e:
+                print(f"重新生成失败: {e}")
+        
+        try:
+            watch(generator.moments_dir, regenerate)
+        except KeyboardInterrupt:
+            print("已停止监视")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+朋友圈HTML生成器 - 导出独立的离线包
+
+普通输出的页面通过相对路径引用朋友圈文件夹中的媒体文件，只能放在朋友圈根目录中查看。
+导出时把页面和它引用的图片、视频（及缩略图）一起写入单独的目录或zip文件：
+- 媒体文件按内容哈希命名（media/ab/abcd….jpg），内容相同的文件只保存一份
+- 目录导出时在线程池中并行复制，shutil.copyfile在支持的系统上使用内核复制（sendfile/fcopyfile）
+- zip中的媒体文件不压缩存储（JPEG/MP4已经是压缩格式），页面和搜索索引按deflate压缩
+- 重新导出时已导出的媒体文件不再复制：目录中已存在的文件直接保留，
+  zip保留原有的媒体条目，只在其后追加新的媒体文件并重写页面
+- 媒体文件的内容哈希缓存在导出目录或zip文件旁的.hashes.json文件中；读取朋友圈时只使用
+  已有的增量缓存清单而不写回，因此默认选项下不在朋友圈根目录中写入任何文件，
+  可以导出只读的备份目录。--thumbnails（缩略图保存在根目录的.thumbnails中）、
+  --index（根目录中的索引数据库）和--merge（哈希缓存在输出文件旁，默认即根目录中）仍会写入文件
+
+用法示例:
+    python direct_html_generator.py --export /Users/mac/Desktop/moments_export
+    python direct_html_generator.py --export /Users/mac/Desktop/moments.zip --search --since 2024-01-01
+"""
+
+import os
+import shutil
+import zipfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from content_hash import FileHashCache
+from direct_html_generator import (write_html_stream, render_search_box, moment_anchor,
+                                   _url_base, _tmp_path, _checkpoint)
+from thumbnails import build_thumbnails
+from search_index import write_search_index, search_dir_for
+from run_stats import RunStats
+
+# 导出的页面文件名
+EXPORT_HTML_NAME = 'index.html'
+# 导出的媒体文件所在的子目录
+MEDIA_DIR_NAME = 'media'
+# 计算哈希和复制媒体文件的并发线程数
+EXPORT_WORKERS = 8
+# 导出的zip文件注释，重新导出时只在带有该注释的zip中追加
+EXPORT_ZIP_COMMENT = b'moments-export/1'
+
+def bundle_name(digest, path):
+    """媒体文件在导出包中的路径（按内容哈希命名，保留小写的扩展名）"""
+    ext = os.path.splitext(path)[1].lower()
+    return f"{MEDIA_DIR_NAME}/{digest[:2]}/{digest}{ext}"
+
+def hash_cache_path_for(dest):
+    """导出时媒体文件哈希缓存的路径：导出目录或zip文件旁、同名加.hashes.json"""
+    return f"{dest}.hashes.json"
+
+def hash_media(paths, cache_file, workers=EXPORT_WORKERS, cancel_event=None):
+    """计算媒体文件的内容哈希，返回{文件路径: 导出包中的路径}
+
+    哈希缓存在cache_file中（导出专用，本次未用到的条目会被清除），未变化的文件不重新读取；
+    无法读取的文件不在返回结果中。
+    """
+    hash_cache = FileHashCache(cache_file)
+    
+    def safe_hash(path):
+        try:
+            return hash_cache.hash_file(path)
+        except OSError as e:
+            print(f"读取媒体文件失败 {path}: {e}")
+    
+    names = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(safe_hash, path): path for path in paths}
+        for future in as_completed(futures):
+            digest = future.result()
+            if digest:
+                path = futures[future]
+                names[path] = bundle_name(digest, path)
+    _checkpoint(cancel_event)
+    hash_cache.save(prune=True)
+    return names
+
+def _copy_file(src, dst):
+    """复制文件内容到dst（先写临时文件再重命名，中断时不会留下不完整的文件）"""
+    tmp_path = _tmp_path(dst)
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def copy_media(files, dest, workers=EXPORT_WORKERS, progress=None, cancel_event=None):
+    """把{导出包中的路径: 源文件}并行复制到dest目录，已存在的文件跳过，返回(复制数, 复用数)"""
+    missing = [(name, src) for name, src in files.items()
+               if not os.path.exists(os.path.join(dest, name))]
+    for directory in {os.path.dirname(name) for name, _ in missing}:
+        os.makedirs(os.path.join(dest, directory), exist_ok=True)
+    
+    copied = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_copy_file, src, os.path.join(dest, name)): src
+                   for name, src in missing}
+        try:
+            for future in as_completed(futures):
+                _checkpoint(cancel_event, progress, 'export', copied, len(missing))
+                try:
+                    future.result()
+                    copied += 1
+                except OSError as e:
+                    print(f"复制媒体文件失败 {futures[future]}: {e}")
+        finally:
+            for future in futures:
+                future.cancel()
+    return copied, len(files) - len(missing)
+
+def _prune_media(dest, files):
+    """删除导出目录中不再被页面引用的媒体文件，返回删除数"""
+    removed = 0
+    media_dir = os.path.join(dest, MEDIA_DIR_NAME)
+    for dirpath, _, filenames in os.walk(media_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, dest).replace(os.sep, '/')
+            if name not in files:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+def _reusable_entries(zip_path, files):
+    """检查已有的导出zip能否追加：返回可保留的媒体条目名集合，需要重建时返回None
+
+    只有本程序导出的zip（媒体条目在前、页面条目在后）且其中的媒体文件都仍被引用时才追加，
+    否则（文件损坏、不是导出的zip或含有不再引用的媒体文件）重建整个zip。
+    """
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            if zf.comment != EXPORT_ZIP_COMMENT:
+                return None
+            infos = zf.infolist()
+    except (OSError, zipfile.BadZipFile):
+        return None
+    media_prefix = MEDIA_DIR_NAME + '/'
+    count = 0
+    while count < len(infos) and infos[count].filename.startswith(media_prefix):
+        count += 1
+    kept = {info.filename for info in infos[:count]}
+    if any(info.filename.startswith(media_prefix) for info in infos[count:]):
+        return None
+    if len(kept) != count or not kept.issubset(files):
+        return None
+    return kept
+
+def write_zip(zip_path, files, page_dir, progress=None, cancel_event=None):
+    """把媒体文件（不压缩）和page_dir中的页面文件（deflate压缩）写入zip，返回(写入数, 复用数)
+
+    files为{导出包中的路径: 源文件}。已有可追加的导出zip时截掉其中的页面条目，
+    只追加新的媒体文件和新的页面；否则写入临时文件后原子替换。
+    """
+    kept = _reusable_entries(zip_path, files) if os.path.exists(zip_path) else None
+    if kept is None:
+        kept = set()
+        target = _tmp_path(zip_path)
+        zf = zipfile.ZipFile(target, 'w', strict_timestamps=False)
+    else:
+        target = zip_path
+        zf = zipfile.ZipFile(zip_path, 'a', strict_timestamps=False)
+        # 媒体条目之后的页面条目全部丢弃，新条目从第一个页面条目的位置开始写入
+        media_infos = [info for info in zf.filelist if info.filename in kept]
+        page_infos = [info for info in zf.filelist if info.filename not in kept]
+        if page_infos:
+            zf.start_dir = min(info.header_offset for info in page_infos)
+        zf.filelist = media_infos
+        zf.NameToInfo = {info.filename: info for info in media_infos}
+    
+    added = [(name, src) for name, src in files.items() if name not in kept]
+    try:
+        with zf:
+            zf.comment = EXPORT_ZIP_COMMENT
+            for done, (name, src) in enumerate(added):
+                _checkpoint(cancel_event, progress, 'export', done, len(added))
+                try:
+                    zf.write(src, name, compress_type=zipfile.ZIP_STORED)
+                except OSError as e:
+                    print(f"写入媒体文件失败 {src}: {e}")
+            for dirpath, _, filenames in os.walk(page_dir):
+                for filename in sorted(filenames):
+                    path = os.path.join(dirpath, filename)
+                    name = os.path.relpath(path, page_dir).replace(os.sep, '/')
+                    zf.write(path, name, compress_type=zipfile.ZIP_DEFLATED)
+        if target != zip_path:
+            os.replace(target, zip_path)
+    except BaseException:
+        # 追加中断的zip无法再使用，下次导出时会检测到并重建
+        if target != zip_path:
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+        raise
+    return len(added), len(kept)
+
+def write_pages(out_dir, title, moments, media_map, thumbs=None, search=False,
+                stats=None, progress=None, cancel_event=None):
+    """把页面（及搜索索引）写入out_dir，媒体路径按media_map改为导出包中的路径"""
+    stats = stats if stats is not None else RunStats()
+    output_file = os.path.join(out_dir, EXPORT_HTML_NAME)
+    header = ""
+    if search:
+        header = render_search_box(_url_base(search_dir_for(output_file), out_dir), "")
+    write_html_stream(output_file, title, moments, out_dir, header=header, thumbs=thumbs,
+                      stats=stats, progress=progress, cancel_event=cancel_event,
+                      media_map=media_map)
+    if search:
+        _checkpoint(cancel_event, progress, 'search')
+        entries = [(m, "", moment_anchor(m)) for m in moments]
+        with stats.stage('search'):
+            write_search_index(output_file, entries)
+    return output_file
+
+def export_bundle(generator, dest, workers=EXPORT_WORKERS, stats=None, progress=None,
+                  cancel_event=None):
+    """按generator的选项导出离线包，dest以.zip结尾时导出为zip文件，否则导出为目录
+
+    使用generator的目录、筛选、索引、缩略图和搜索选项（不支持分页和虚拟滚动输出），
+    不写入朋友圈根目录中的输出文件。返回(新复制的媒体文件数, 复用的媒体文件数)。
+    """
+    if generator.shard_by or generator.virtual:
+        raise ValueError("导出不支持分页输出或虚拟滚动输出")
+    stats = stats if stats is not None else RunStats()
+    dest = os.path.abspath(dest)
+    as_zip = dest.lower().endswith('.zip')
+    
+    moments = generator.load_moments(stats=stats, progress=progress, cancel_event=cancel_event,
+                                     save_cache=False)
+    title = f"{moments[0].user}朋友圈" if moments else "朋友圈时间线"
+    stats.incr('images', sum(len(m.images) for m in moments))
+    stats.incr('videos', sum(len(m.videos) for m in moments))
+    
+    media_paths = [path for moment in moments for path in moment.image_paths()]
+    thumbs = None
+    if generator.thumbnails:
+        with stats.stage('thumbnails'):
+            thumbs = build_thumbnails(
+                generator.moments_dir, media_paths, cancel_event=cancel_event,
+                progress=progress and (lambda done, total: progress('thumbnails', done, total)),
+                prune=generator.folder_filter is None)
+        _checkpoint(cancel_event)
+    media_paths += [path for moment in moments for path in moment.video_paths()]
+    if thumbs:
+        media_paths += thumbs.values()
+    
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with stats.stage('export'):
+        media_map = hash_media(set(media_paths), hash_cache_path_for(dest), workers, cancel_event)
+    files = {name: path for path, name in media_map.items()}
+    if as_zip:
+        # 页面先写入zip旁边的临时目录，再与媒体文件一起写入zip
+        page_dir = tempfile.mkdtemp(prefix='.moments-export-', dir=os.path.dirname(dest))
+        try:
+            write_pages(page_dir, title, moments, media_map, thumbs, generator.search,
+                        stats, progress, cancel_event)
+            with stats.stage('export'):
+                copied, reused = write_zip(dest, files, page_dir, progress, cancel_event)
+        finally:
+            shutil.rmtree(page_dir, ignore_errors=True)
+    else:
+        os.makedirs(dest, exist_ok=True)
+        with stats.stage('export'):
+            copied, reused = copy_media(files, dest, workers, progress, cancel_event)
+        write_pages(dest, title, moments, media_map, thumbs, generator.search,
+                    stats, progress, cancel_event)
+        removed = _prune_media(dest, files)
+        if removed:
+            print(f"删除了 {removed} 个不再引用的媒体文件")
+    stats.incr('media_copied', copied)
+    stats.incr('media_reused', reused)
+    stats.finish()
+    
+    print(f"已导出到: {dest}（新复制 {copied} 个媒体文件，复用 {reused} 个）")
+    for line in stats.summary_lines():
+        print(line)
+    return copied, reused
@@ -5,7 +5,14 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
 import threading
 import webbrowser
-from direct_html_generator import generate_html, MOMENTS_DIR, HTML_FILE
+from direct_html_generator import (MomentsGenerator, GenerationCancelled, MOMENTS_DIR, HTML_FILE,
+                                   parse_date)
+from moments_index import MomentsIndex, from_timestamp
+from run_stats import RunStats, STAGE_LABELS
+from preview_server import PreviewServer
+
+# 生成过程中刷新进度条的间隔（毫秒）
+PROGRESS_POLL_MS = 100
 
 class MomentsGUI:
     def __init__(self, root):
@@ -34,6 +41,18 @@ class MomentsGUI:
         self.moments_dir = MOMENTS_DIR
         self.output_file = HTML_FILE
         
+        # 生成任务互斥锁（手动生成与监视触发的生成不同时进行）
+        self.generate_lock = threading.Lock()
+        # 当前生成任务的取消事件和最新进度（由生成线程写入，主线程定时读取）
+        self.cancel_event = None
+        self.progress_state = None
+        # 监视线程的停止事件，未监视时为None
+        self.watch_stop = None
+        # 最近一次校验通过的筛选条件（生成线程只读取这里，不访问界面变量）
+        self.filter_options = {}
+        # 本地预览服务器，第一次预览时启动
+        self.preview_server = None
+        
         # 更新界面显示
         self.update_display()
     
@@ -182,6 +201,23 @@ class MomentsGUI:
         self.output_entry.grid(row=1, column=1, sticky="ew", padx=(10, 10))
         ttk.Button(path_frame, text="💾 选择", command=self.browse_output_file, style='Modern.TButton').grid(row=1, column=2)
         
+        # 筛选条件（只按文件夹名筛选，留空表示不限）
+        ttk.Label(path_frame, text="日期范围:", style='Modern.TLabel').grid(row=2, column=0, sticky=tk.W, pady=(10, 0))
+        date_frame = ttk.Frame(path_frame)
+        date_frame.grid(row=2, column=1, sticky="w", padx=(10, 10), pady=(10, 0))
+        self.since_var = tk.StringVar()
+        self.until_var = tk.StringVar()
+        ttk.Entry(date_frame, textvariable=self.since_var, width=12, style='Modern.TEntry').grid(row=0, column=0)
+        ttk.Label(date_frame, text=" 至 ", style='Modern.TLabel').grid(row=0, column=1)
+        ttk.Entry(date_frame, textvariable=self.until_var, width=12, style='Modern.TEntry').grid(row=0, column=2)
+        ttk.Label(date_frame, text="  (YYYY-MM-DD，留空不限)", style='Modern.TLabel').grid(row=0, column=3)
+        
+        ttk.Label(path_frame, text="用户:", style='Modern.TLabel').grid(row=3, column=0, sticky=tk.W, pady=(10, 0))
+        self.users_var = tk.StringVar()
+        ttk.Entry(path_frame, textvariable=self.users_var, width=50, style='Modern.TEntry').grid(
+            row=3, column=1, sticky="ew", padx=(10, 10), pady=(10, 0))
+        ttk.Label(path_frame, text="多个用逗号分隔", style='Modern.TLabel').grid(row=3, column=2, pady=(10, 0))
+        
         # Mac风格操作按钮区域
         action_frame = ttk.LabelFrame(main_frame, text="🚀 操作中心", padding="25", style='Modern.TLabelframe')
         action_frame.grid(row=2, column=0, columnspan=3, sticky="ew", pady=(0, 20))
@@ -199,6 +235,12 @@ class MomentsGUI:
         self.open_dir_btn = ttk.Button(action_frame, text="📁 打开目录", command=self.open_directory, style='Modern.TButton')
         self.open_dir_btn.grid(row=1, column=1, padx=(0, 10), sticky="ew")
         
+        # 监视目录开关
+        self.watch_var = tk.BooleanVar(value=False)
+        self.watch_check = ttk.Checkbutton(action_frame, text="👁️ 监视目录变化并自动重新生成",
+                                           variable=self.watch_var, command=self.toggle_watch)
+        self.watch_check.grid(row=2, column=0, columnspan=2, sticky="w", pady=(10, 0))
+        
         # 配置按钮列权重
         action_frame.columnconfigure(0, weight=1)
         action_frame.columnconfigure(1, weight=1)
@@ -214,9 +256,14 @@ class MomentsGUI:
         self.status_label.grid(row=0, column=0, sticky="w", pady=(0, 10))
         
         # 进度条
-        self.progress = ttk.Progressbar(status_frame, mode='indeterminate', style='Modern.Horizontal.TProgressbar')
+        self.progress = ttk.Progressbar(status_frame, mode='indeterminate', maximum=100, style='Modern.Horizontal.TProgressbar')
         self.progress.grid(row=1, column=0, sticky="ew")
         
+        # 取消按钮（仅在生成过程中可用）
+        self.cancel_btn = ttk.Button(status_frame, text="⛔ 取消", command=self.cancel_generation, style='Warning.TButton')
+        self.cancel_btn.grid(row=1, column=1, padx=(10, 0))
+        self.cancel_btn.state(['disabled'])
+        
         # Mac风格信息显示区域
         info_frame = ttk.LabelFrame(main_frame, text="📊 运行日志", padding="20", style='Modern.TLabelframe')
         info_frame.grid(row=4, column=0, columnspan=3, sticky="nsew", pady=(0, 20))
@@ -271,79 +318,250 @@ class MomentsGUI:
             self.log_message(f"💾 已选择输出文件: {file_path}")
     
     def scan_moments(self):
-        """扫描朋友圈目录"""
+        """扫描朋友圈目录（在后台线程中进行，结果分批显示）"""
         if not os.path.exists(self.moments_dir):
             messagebox.showerror("错误", "朋友圈目录不存在！")
             return
         
         self.log_message("开始扫描朋友圈目录...")
+        self.scan_btn.state(['disabled'])
+        thread = threading.Thread(target=self._scan_thread, args=(self.moments_dir,))
+        thread.daemon = True
+        thread.start()
+    
+    def _scan_thread(self, moments_dir):
+        """在线程中通过SQLite索引扫描，只重新读取有变化的文件夹"""
+        summary = {'total': 0, 'first': None, 'last': None, 'images': 0, 'videos': 0}
+        
+        def on_batch(items, done, total):
+            for _, ts, image_count, video_count in items:
+                summary['total'] += 1
+                summary['images'] += image_count
+                summary['videos'] += video_count
+                if summary['first'] is None or ts < summary['first']:
+                    summary['first'] = ts
+                if summary['last'] is None or ts > summary['last']:
+                    summary['last'] = ts
+            snapshot = dict(summary)
+            self.root.after(0, lambda: self._show_scan_progress(snapshot, done, total))
         
         try:
-            folders = []
-            for item in os.listdir(self.moments_dir):
-                item_path = os.path.join(self.moments_dir, item)
-                if os.path.isdir(item_path) and '_' in item:
-                    folders.append(item)
-            
-            folders.sort(reverse=True)  # 按时间倒序
-            
-            self.log_message(f"📊 找到 {len(folders)} 个朋友圈文件夹:")
-            for folder in folders[:10]:  # 只显示前10个
-                self.log_message(f"  📁 {folder}")
-            
-            if len(folders) > 10:
-                self.log_message(f"  📋 ... 还有 {len(folders) - 10} 个文件夹")
-            
-            if not folders:
-                self.log_message("⚠️ 未找到有效的朋友圈文件夹")
-                self.set_status("未找到朋友圈数据", "warning")
+            with MomentsIndex(moments_dir) as index:
+                # 先显示索引中已有的结果，再与文件系统同步
+                cached = index.count()
+                if cached:
+                    # 在扫描线程中格式化好消息：下面的变量在刷新后会被重新赋值
+                    first, last = index.date_range()
+                    image_count, video_count = index.media_count()
+                    message = (f"📦 索引中已有 {cached} 个朋友圈（{first:%Y-%m-%d} ~ {last:%Y-%m-%d}，"
+                               f"图片 {image_count} 张，视频 {video_count} 个），正在检查变化...")
+                    self.root.after(0, lambda message=message: self.log_message(message))
+                
+                updated, removed, unchanged = index.refresh(on_batch=on_batch)
+                total = index.count()
+                first, last = index.date_range()
+                image_count, video_count = index.media_count()
+                recent = [moment.folder for moment in index.query(limit=10)]  # 按时间倒序
             
+            self.root.after(0, lambda: self._show_scan_result(
+                updated, removed, unchanged, total, first, last, image_count, video_count, recent))
         except Exception as e:
-            self.log_message(f"扫描出错: {str(e)}")
-            messagebox.showerror("错误", f"扫描朋友圈目录时出错:\n{str(e)}")
+            error = str(e)
+            self.root.after(0, lambda: self.log_message(f"扫描出错: {error}"))
+            self.root.after(0, lambda: messagebox.showerror("错误", f"扫描朋友圈目录时出错:\n{error}"))
+        finally:
+            self.root.after(0, lambda: self.scan_btn.state(['!disabled']))
+    
+    def _show_scan_progress(self, summary, done, total):
+        """显示扫描中的累计结果（主线程）"""
+        text = f"已扫描 {done}/{total} · 朋友圈 {summary['total']}"
+        if summary['first'] is not None:
+            first = from_timestamp(summary['first'])
+            last = from_timestamp(summary['last'])
+            text += f" · {first:%Y-%m-%d} ~ {last:%Y-%m-%d}"
+        text += f" · 图片 {summary['images']} 视频 {summary['videos']}"
+        self.set_status(text, "loading")
+        # 生成过程中进度条由生成任务使用
+        if self.cancel_event is None and total:
+            self.progress.configure(mode='determinate', value=done * 100 / total)
+    
+    def _show_scan_result(self, updated, removed, unchanged, total, first, last,
+                          image_count, video_count, recent):
+        """显示扫描完成后的结果（主线程）"""
+        self.log_message(f"🗂️ 索引已更新：新增或修改 {updated} 个，删除 {removed} 个，未变化 {unchanged} 个")
+        self.log_message(f"📊 找到 {total} 个朋友圈文件夹:")
+        if total:
+            self.log_message(f"  📅 时间范围: {first:%Y-%m-%d} ~ {last:%Y-%m-%d}")
+            self.log_message(f"  🖼️ 图片 {image_count} 张，🎬 视频 {video_count} 个")
+        for folder in recent:  # 只显示前10个
+            self.log_message(f"  📁 {folder}")
+        
+        if total > 10:
+            self.log_message(f"  📋 ... 还有 {total - 10} 个文件夹")
+        
+        if total:
+            self.set_status(f"扫描完成，共 {total} 个朋友圈", "success")
+        else:
+            self.log_message("⚠️ 未找到有效的朋友圈文件夹")
+            self.set_status("未找到朋友圈数据", "warning")
+    
+    def _read_filter_options(self):
+        """读取并校验筛选条件，保存到filter_options；格式错误时提示并返回False"""
+        try:
+            since = parse_date(self.since_var.get()) if self.since_var.get().strip() else None
+            until = parse_date(self.until_var.get()) if self.until_var.get().strip() else None
+        except ValueError:
+            messagebox.showerror("错误", "日期格式应为YYYY-MM-DD！")
+            return False
+        if since and until and since > until:
+            messagebox.showerror("错误", "开始日期不能晚于结束日期！")
+            return False
+        users = [name.strip() for name in self.users_var.get().replace('，', ',').split(',') if name.strip()]
+        self.filter_options = {'since': since, 'until': until, 'users': users or None}
+        return True
     
     def generate_html_file(self):
         """生成HTML文件"""
         if not os.path.exists(self.moments_dir):
             messagebox.showerror("错误", "朋友圈目录不存在！")
             return
+        if not self._read_filter_options():
+            return
         
         # 在新线程中执行生成操作
         thread = threading.Thread(target=self._generate_html_thread)
         thread.daemon = True
         thread.start()
     
-    def _generate_html_thread(self):
-        """在线程中生成HTML"""
+    def _generate_html_thread(self, changed_folders=None, notify=True):
+        """在线程中生成HTML
+
+        changed_folders为监视模式提供的变化文件夹集合；notify为False时不弹出结果对话框。
+        """
+        with self.generate_lock:
+            self._generate_html(changed_folders, notify)
+    
+    def _generate_html(self, changed_folders, notify):
+        """生成HTML（调用方需持有generate_lock）"""
+        self.cancel_event = threading.Event()
+        self.progress_state = None
+        self.root.after(0, self._start_progress)
         try:
-            self.root.after(0, lambda: self.set_status("正在生成HTML文件...", "loading"))
-            self.root.after(0, lambda: self.progress.start())
-            
-            # 临时修改全局变量
-            import direct_html_generator
-            original_dir = direct_html_generator.MOMENTS_DIR
-            original_file = direct_html_generator.HTML_FILE
-            
-            direct_html_generator.MOMENTS_DIR = self.moments_dir
-            direct_html_generator.HTML_FILE = self.output_file
-            
             # 生成HTML
-            output_file = generate_html()
+            generator = MomentsGenerator(self.moments_dir, self.output_file, **self.filter_options)
+            stats = RunStats()
+            output_file = generator.generate(changed_folders=changed_folders, stats=stats,
+                                             progress=self._on_progress,
+                                             cancel_event=self.cancel_event)
             
-            # 恢复全局变量
-            direct_html_generator.MOMENTS_DIR = original_dir
-            direct_html_generator.HTML_FILE = original_file
-            
-            self.root.after(0, lambda: self.progress.stop())
+            self.root.after(0, lambda: self._stop_progress(100))
             self.root.after(0, lambda: self.set_status("HTML文件生成完成", "success"))
             self.root.after(0, lambda: self.log_message(f"✅ HTML文件已生成: {output_file}"))
-            self.root.after(0, lambda: messagebox.showinfo("🎉 生成成功", f"HTML文件已生成:\n{output_file}"))
-            
+            for line in stats.summary_lines():
+                self.root.after(0, lambda line=line: self.log_message(f"  ⏱️ {line}"))
+            if notify:
+                self.root.after(0, lambda: messagebox.showinfo("🎉 生成成功", f"HTML文件已生成:\n{output_file}"))
+        
+        except GenerationCancelled:
+            self.root.after(0, lambda: self._stop_progress(0))
+            self.root.after(0, lambda: self.set_status("已取消生成", "warning"))
+            self.root.after(0, lambda: self.log_message("⛔ 已取消生成，原有HTML文件保持不变"))
+        
         except Exception as e:
-            self.root.after(0, lambda: self.progress.stop())
+            error = str(e)
+            self.root.after(0, lambda: self._stop_progress(0))
             self.root.after(0, lambda: self.set_status("生成失败", "error"))
-            self.root.after(0, lambda: self.log_message(f"❌ 生成HTML文件时出错: {str(e)}"))
-            self.root.after(0, lambda: messagebox.showerror("❌ 生成失败", f"生成HTML文件时出错:\n{str(e)}"))
+            self.root.after(0, lambda: self.log_message(f"❌ 生成HTML文件时出错: {error}"))
+            if notify:
+                self.root.after(0, lambda: messagebox.showerror("❌ 生成失败", f"生成HTML文件时出错:\n{error}"))
+        
+        finally:
+            self.cancel_event = None
+    
+    def _on_progress(self, stage, done, total):
+        """生成线程的进度回调：只记录最新进度，由主线程定时刷新界面"""
+        self.progress_state = (stage, done, total)
+    
+    def _start_progress(self):
+        """开始显示进度（主线程）"""
+        self.set_status("正在生成HTML文件...", "loading")
+        self.progress.configure(mode='indeterminate', value=0)
+        self.progress.start()
+        self.cancel_btn.state(['!disabled'])
+        self.root.after(PROGRESS_POLL_MS, self._poll_progress)
+    
+    def _poll_progress(self):
+        """定时把生成线程报告的进度刷新到进度条和状态栏（主线程）"""
+        if self.cancel_event is None:
+            return
+        state = self.progress_state
+        if state:
+            stage, done, total = state
+            label = STAGE_LABELS.get(stage, stage)
+            if total:
+                if str(self.progress.cget('mode')) != 'determinate':
+                    self.progress.stop()
+                    self.progress.configure(mode='determinate')
+                self.progress.configure(value=done * 100 / total)
+                self.set_status(f"正在{label}... {done}/{total}", "loading")
+            else:
+                if str(self.progress.cget('mode')) != 'indeterminate':
+                    self.progress.configure(mode='indeterminate')
+                    self.progress.start()
+                self.set_status(f"正在{label}...", "loading")
+        self.root.after(PROGRESS_POLL_MS, self._poll_progress)
+    
+    def _stop_progress(self, value):
+        """结束进度显示（主线程）"""
+        self.progress.stop()
+        self.progress.configure(mode='determinate', value=value)
+        self.cancel_btn.state(['disabled'])
+    
+    def cancel_generation(self):
+        """请求取消正在进行的生成"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.set_status("正在取消...", "loading")
+            self.log_message("⏹️ 已请求取消生成")
+    
+    def toggle_watch(self):
+        """开启或关闭目录监视"""
+        if not self.watch_var.get():
+            if self.watch_stop:
+                self.watch_stop.set()
+                self.watch_stop = None
+                self.log_message("⏹️ 已停止监视目录")
+            return
+        
+        if not os.path.exists(self.moments_dir):
+            self.watch_var.set(False)
+            messagebox.showerror("错误", "朋友圈目录不存在！")
+            return
+        if not self._read_filter_options():
+            self.watch_var.set(False)
+            return
+        
+        self.watch_stop = threading.Event()
+        thread = threading.Thread(target=self._watch_thread, args=(self.moments_dir, self.watch_stop))
+        thread.daemon = True
+        thread.start()
+        self.log_message(f"👁️ 开始监视目录: {self.moments_dir}")
+    
+    def _watch_thread(self, moments_dir, stop_event):
+        """在线程中监视目录，变化时只重新处理变化的文件夹"""
+        from watcher import watch
+        
+        def regenerate(folders):
+            count = "全部" if folders is None else f"{len(folders)} 个"
+            self.root.after(0, lambda: self.log_message(f"🔄 检测到{count}文件夹变化，重新生成..."))
+            self._generate_html_thread(changed_folders=folders, notify=False)
+        
+        try:
+            watch(moments_dir, regenerate, stop_event)
+        except Exception as e:
+            error = str(e)
+            self.root.after(0, lambda: self.watch_var.set(False))
+            self.root.after(0, lambda: self.log_message(f"❌ 监视目录时出错: {error}"))
     
     def preview_html(self):
         """预览HTML文件"""
@@ -352,12 +570,28 @@ class MomentsGUI:
             return
         
         try:
-            webbrowser.open(f"file://{os.path.abspath(self.output_file)}")
-            self.log_message(f"🌐 已在浏览器中打开: {self.output_file}")
+            url = self._preview_url(self.output_file)
+            webbrowser.open(url)
+            self.log_message(f"🌐 已在浏览器中打开: {url}")
         except Exception as e:
             self.log_message(f"打开HTML文件时出错: {str(e)}")
             messagebox.showerror("错误", f"打开HTML文件时出错:\n{str(e)}")
     
+    def _preview_url(self, path):
+        """通过本地预览服务器访问文件的地址；文件不在朋友圈目录中或服务器无法启动时使用file://"""
+        root = os.path.abspath(self.moments_dir)
+        if self.preview_server and self.preview_server.root != root:
+            self.preview_server.stop()
+            self.preview_server = None
+        try:
+            if self.preview_server is None:
+                self.preview_server = PreviewServer(root).start()
+                self.log_message(f"🖥️ 预览服务器已启动: {self.preview_server.base_url}")
+            return self.preview_server.url_for(path)
+        except (OSError, ValueError) as e:
+            self.log_message(f"⚠️ 无法通过预览服务器打开（{e}），改用本地文件方式")
+            return f"file://{os.path.abspath(path)}"
+    
     def open_directory(self):
         """打开朋友圈目录"""
         if not os.path.exists(self.moments_dir):
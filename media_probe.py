@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+媒体文件头探测
+
+只读取文件开头的少量字节得到图片尺寸，不解码图片、不依赖Pillow：
+JPEG读取到SOF段为止（跳过其它段时只读段长度），PNG只读IHDR块。
+JPEG的EXIF方向为旋转90度时交换宽高，得到的是浏览器显示时的尺寸。
+
+视频只读取容器的头部结构：MP4/MOV逐个读取box头并跳过媒体数据（mdat），
+只读取moov中的mvhd（时长）和tkhd（画面尺寸、旋转），AVI只读取avih。
+"""
+
+import os
+import struct
+
+# PNG文件签名
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG中带有图片尺寸的SOF段标记（不含DHT、JPG、DAC）
+JPEG_SOF_MARKERS = frozenset({0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                              0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF})
+# 没有长度字段的JPEG标记（TEM、RSTn、SOI、EOI）
+JPEG_STANDALONE_MARKERS = frozenset({0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7,
+                                     0xD8, 0xD9})
+# 解析EXIF方向时最多读取的APP1段字节数（方向标签位于开头的IFD0中）
+EXIF_READ_SIZE = 4096
+# EXIF方向标签
+EXIF_ORIENTATION_TAG = 0x0112
+
+def _exif_orientation(data):
+    """从APP1段内容中解析EXIF方向（1~8），无法解析时返回1"""
+    if not data.startswith(b'Exif\x00\x00') or len(data) < 14:
+        return 1
+    tiff = data[6:]
+    if tiff[:2] == b'II':
+        order = '<'
+    elif tiff[:2] == b'MM':
+        order = '>'
+    else:
+        return 1
+    ifd_offset = struct.unpack(order + 'I', tiff[4:8])[0]
+    if ifd_offset + 2 > len(tiff):
+        return 1
+    count = struct.unpack(order + 'H', tiff[ifd_offset:ifd_offset + 2])[0]
+    for i in range(count):
+        entry = tiff[ifd_offset + 2 + i * 12:ifd_offset + 14 + i * 12]
+        if len(entry) < 12:
+            break
+        tag, value_type = struct.unpack(order + 'HH', entry[:4])
+        if tag == EXIF_ORIENTATION_TAG and value_type == 3:
+            return struct.unpack(order + 'H', entry[8:10])[0]
+    return 1
+
+def _jpeg_size(f):
+    """读取JPEG的SOF段得到(宽, 高)，文件指针位于SOI之后"""
+    orientation = 1
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        while marker == b'\xff':  # 填充字节
+            marker = f.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        header = f.read(2)
+        if len(header) < 2:
+            return None
+        length = struct.unpack('>H', header)[0]
+        if length < 2:
+            return None
+        if marker in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            if not width or not height:
+                return None
+            if orientation in (5, 6, 7, 8):
+                width, height = height, width
+            return width, height
+        if marker == 0xDA:  # 图像数据开始之前都没有SOF段
+            return None
+        if marker == 0xE1 and orientation == 1:
+            data = f.read(min(length - 2, EXIF_READ_SIZE))
+            orientation = _exif_orientation(data)
+            f.seek(length - 2 - len(data), 1)
+        else:
+            f.seek(length - 2, 1)
+
+def probe_image_size(path):
+    """只读取文件头得到图片的显示尺寸(宽, 高)，不是JPEG/PNG或无法解析时返回None
+
+    按文件内容而不是扩展名判断格式（扩展名为.jpg的PNG同样可以识别）。
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(24)
+            if head.startswith(PNG_SIGNATURE):
+                if len(head) < 24 or head[12:16] != b'IHDR':
+                    return None
+                width, height = struct.unpack('>II', head[16:24])
+                return (width, height) if width and height else None
+            if head[:2] == b'\xff\xd8':
+                f.seek(2)
+                return _jpeg_size(f)
+    except (OSError, struct.error):
+        return None
+    return None
+
+# 按扩展名推断的视频MIME类型（无法从文件头识别时使用）
+VIDEO_MIME_TYPES = {
+    '.mp4': 'video/mp4',
+    '.m4v': 'video/mp4',
+    '.mov': 'video/quicktime',
+    '.avi': 'video/x-msvideo',
+}
+# MP4/MOV中需要进入查找的容器box
+MP4_CONTAINER_BOXES = frozenset({b'moov', b'trak'})
+
+def _iter_boxes(f, start, end):
+    """逐个读取[start, end)范围内的box头，生成(类型, 内容起始位置, 内容结束位置)"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        payload = pos + 8
+        if size == 1:  # 64位长度
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack('>Q', large)[0]
+            payload += 8
+        elif size == 0:  # 延续到文件末尾
+            size = end - pos
+        if size < payload - pos:
+            return
+        yield box_type, payload, min(pos + size, end)
+        pos += size
+
+def _read_mvhd(f, start):
+    """读取mvhd，返回时长（秒）"""
+    f.seek(start)
+    version = f.read(1)
+    if version == b'\x01':
+        f.seek(start + 20)
+        timescale, duration = struct.unpack('>IQ', f.read(12))
+    else:
+        f.seek(start + 12)
+        timescale, duration = struct.unpack('>II', f.read(8))
+    if not timescale or duration in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+        return None
+    return round(duration / timescale, 3)
+
+def _read_tkhd(f, start):
+    """读取tkhd，返回显示尺寸(宽, 高)（按变换矩阵处理90度旋转），音频轨道返回None"""
+    f.seek(start)
+    version = f.read(1)
+    matrix_offset = start + (52 if version == b'\x01' else 40)
+    f.seek(matrix_offset)
+    data = f.read(44)
+    if len(data) < 44:
+        return None
+    a, b = struct.unpack('>ii', data[:8])
+    width, height = struct.unpack('>II', data[36:44])
+    width, height = width >> 16, height >> 16
+    if not width or not height:
+        return None
+    if a == 0 and b != 0:  # 旋转90度或270度
+        width, height = height, width
+    return width, height
+
+def _mp4_info(f, file_size):
+    """读取MP4/MOV的ftyp、mvhd和第一个视频轨道的tkhd，返回(MIME类型, 时长, 宽, 高)"""
+    mime = 'video/mp4'
+    duration = None
+    size = None
+    pending = [(0, file_size)]
+    while pending:
+        start, end = pending.pop(0)  # 按文件中的顺序，第一个视频轨道的尺寸优先
+        for box_type, payload, box_end in _iter_boxes(f, start, end):
+            if box_type == b'ftyp':
+                f.seek(payload)
+                if f.read(4) == b'qt  ':
+                    mime = 'video/quicktime'
+            elif box_type == b'mvhd':
+                duration = _read_mvhd(f, payload)
+            elif box_type == b'tkhd':
+                if size is None:
+                    size = _read_tkhd(f, payload)
+            elif box_type in MP4_CONTAINER_BOXES:
+                pending.append((payload, box_end))
+    width, height = size or (None, None)
+    return mime, duration, width, height
+
+def _avi_info(f):
+    """读取AVI的avih，返回(MIME类型, 时长, 宽, 高)"""
+    f.seek(0)
+    head = f.read(256)
+    index = head.find(b'avih')
+    if index < 0 or len(head) < index + 48:
+        return 'video/x-msvideo', None, None, None
+    fields = struct.unpack('<10I', head[index + 8:index + 48])
+    micro_sec_per_frame, total_frames = fields[0], fields[4]
+    width, height = fields[8], fields[9]
+    duration = round(micro_sec_per_frame * total_frames / 1e6, 3) if micro_sec_per_frame else None
+    return 'video/x-msvideo', duration, width or None, height or None
+
+def probe_video(path):
+    """只读取容器头部得到视频信息(MIME类型, 时长秒数, 宽, 高)，无法识别的项为None
+
+    MIME类型由文件内容判断（QuickTime品牌的.mp4同样识别为video/quicktime），
+    文件头无法识别时按扩展名推断。
+    """
+    mime = VIDEO_MIME_TYPES.get(os.path.splitext(path)[1].lower(), 'video/mp4')
+    try:
+        with open(path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            head = f.read(12)
+            if head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+                return _avi_info(f)
+            if head[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip'):
+                found_mime, duration, width, height = _mp4_info(f, file_size)
+                if head[4:8] != b'ftyp':  # 没有ftyp的旧QuickTime文件
+                    found_mime = mime
+                return found_mime, duration, width, height
+    except (OSError, struct.error):
+        pass
+    return mime, None, None, None
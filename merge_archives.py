@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+朋友圈HTML生成器 - 合并多个备份目录
+
+同一账号在不同时间导出的多个朋友圈目录往往大量重叠。合并时分别读取每个目录
+（各自使用增量缓存清单），以(发布时间, 内容哈希)为键去重：内容哈希由文本、链接和
+各图片、视频文件的内容哈希计算，文件夹名或媒体文件名不同但内容相同的朋友圈只保留一条
+（保留排在前面的目录中的一份）。只有发布时间相同的朋友圈才需要计算内容哈希。
+
+媒体文件的内容哈希按修改时间和大小缓存在输出文件旁的哈希缓存文件中，
+重复合并时未变化的文件不重新读取。
+
+用法示例:
+    python direct_html_generator.py --moments-dir /data/moments_2024 --merge /data/moments_2023
+"""
+
+import os
+import json
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from content_hash import FileHashCache
+from direct_html_generator import collect_moments, _checkpoint
+from run_stats import RunStats
+
+# 计算媒体文件内容哈希的并发线程数
+MERGE_HASH_WORKERS = 8
+
+def hash_cache_path_for(output_file):
+    """合并时媒体文件哈希缓存的路径：与输出文件同名、扩展名为.hashes.json"""
+    root, _ = os.path.splitext(output_file)
+    return f"{root}.hashes.json"
+
+def moment_content_key(moment, hash_cache):
+    """朋友圈的去重键：(时间戳, 文本、链接及图片、视频内容的哈希)，缺失的媒体文件按None计算"""
+    def media_hashes(paths):
+        hashes = []
+        for path in paths:
+            try:
+                hashes.append(hash_cache.hash_file(path))
+            except OSError:
+                hashes.append(None)
+        return hashes
+    
+    content = [moment.text, moment.url,
+               media_hashes(moment.image_paths()), media_hashes(moment.video_paths())]
+    digest = hashlib.sha1(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()
+    return moment.ts, digest
+
+def merge_moments(roots, hash_cache_file, use_cache=True, workers=1, stats=None,
+                  progress=None, cancel_event=None, folder_filter=None,
+                  hash_workers=MERGE_HASH_WORKERS, save_cache=True):
+    """读取并合并多个朋友圈目录，返回去重后按时间从新到旧排序的朋友圈（Moment）列表
+
+    roots中排在前面的目录优先：重复的朋友圈保留最先读到的一份。
+    use_cache/workers/folder_filter/save_cache按collect_moments()的含义用于每个目录；
+    hash_cache_file为媒体文件哈希缓存文件，本次未用到的条目会被清除（指定folder_filter时保留）。
+    """
+    stats = stats or RunStats()
+    moments = []
+    for root in roots:
+        moments.extend(collect_moments(root, use_cache=use_cache, workers=workers, stats=stats,
+                                       progress=progress, cancel_event=cancel_event,
+                                       folder_filter=folder_filter, save_cache=save_cache))
+    
+    _checkpoint(cancel_event, progress, 'merge')
+    with stats.stage('merge'):
+        # 发布时间不同的朋友圈不可能重复，只为时间相同的朋友圈计算内容哈希
+        by_ts = defaultdict(list)
+        for moment in moments:
+            by_ts[moment.ts].append(moment)
+        candidates = [moment for group in by_ts.values() if len(group) > 1 for moment in group]
+        
+        hash_cache = FileHashCache(hash_cache_file)
+        with ThreadPoolExecutor(max_workers=hash_workers) as executor:
+            keys = dict(zip(map(id, candidates),
+                            executor.map(lambda m: moment_content_key(m, hash_cache), candidates)))
+        _checkpoint(cancel_event)
+        hash_cache.save(prune=folder_filter is None)
+        
+        merged = []
+        seen = set()
+        for moment in moments:
+            key = keys.get(id(moment))
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            merged.append(moment)
+        
+        # 按时间从新到旧排序，时间相同时按文件夹名排序；稳定排序，完全相同的保持目录顺序
+        merged.sort(key=lambda m: (m.ts, m.folder), reverse=True)
+    
+    duplicates = len(moments) - len(merged)
+    stats.incr('duplicates_merged', duplicates)
+    # collect_moments()按每个目录累加了朋友圈数，报告中的朋友圈数应为合并后的条数
+    stats.incr('folders_accepted', -duplicates)
+    print(f"合并 {len(roots)} 个目录：共 {len(moments)} 条朋友圈，去除重复 {duplicates} 条")
+    return merged
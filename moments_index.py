@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+朋友圈SQLite索引
+
+把每个朋友圈文件夹的日期时间、用户名、文本、链接、媒体文件列表及修改时间
+记录在朋友圈根目录下的SQLite数据库中。刷新索引时只重新读取签名变化的文件夹，
+生成HTML和GUI扫描可以直接查询索引，按日期范围排序查询和计数都不需要遍历目录树。
+"""
+
+import os
+import json
+import sqlite3
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from direct_html_generator import (extract_datetime, get_user_name, get_moment_content,
+                                   folder_signature, list_moment_folders, to_timestamp,
+                                   from_timestamp, Moment)
+
+# 索引数据库文件名（保存在朋友圈根目录下）
+INDEX_NAME = '.moments_index.sqlite3'
+# 表结构版本，结构变化时递增以重建索引
+SCHEMA_VERSION = 3
+# 刷新索引时每批处理的文件夹数
+REFRESH_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS moments (
+    folder TEXT PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    text TEXT NOT NULL,
+    url TEXT NOT NULL,
+    images TEXT NOT NULL,
+    videos TEXT NOT NULL,
+    image_count INTEGER NOT NULL,
+    video_count INTEGER NOT NULL,
+    media_mtimes TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    image_sizes TEXT NOT NULL,
+    video_info TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS moments_ts ON moments (ts);
+"""
+
+def _read_folder(moments_dir, folder):
+    """读取单个文件夹，返回可直接写入索引的一行（在线程池中执行）"""
+    folder_path = os.path.join(moments_dir, folder)
+    content = get_moment_content(folder_path)
+    media_mtimes = {}
+    for path in content['images'] + content['videos']:
+        try:
+            media_mtimes[os.path.basename(path)] = os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    return (
+        folder,
+        to_timestamp(extract_datetime(folder)),
+        get_user_name(folder),
+        content['text'],
+        content['url'],
+        json.dumps([os.path.basename(p) for p in content['images']], ensure_ascii=False),
+        json.dumps([os.path.basename(p) for p in content['videos']], ensure_ascii=False),
+        len(content['images']),
+        len(content['videos']),
+        json.dumps(media_mtimes, ensure_ascii=False),
+        json.dumps(content['image_sizes']),
+        json.dumps(content['video_info']),
+    )
+
+def _check_folder(moments_dir, known, folder):
+    """计算文件夹签名，签名与索引中记录的不同时重新读取，返回(签名, 新行或None)"""
+    if not extract_datetime(folder):
+        return None, None
+    signature = json.dumps(folder_signature(os.path.join(moments_dir, folder)))
+    if known.get(folder) == signature:
+        return signature, None
+    return signature, _read_folder(moments_dir, folder)
+
+class MomentsIndex:
+    """朋友圈目录的SQLite索引，同一实例只应在一个线程中使用"""
+    
+    def __init__(self, moments_dir, db_path=None):
+        self.moments_dir = moments_dir
+        self.db_path = db_path or os.path.join(moments_dir, INDEX_NAME)
+        self.conn = sqlite3.connect(self.db_path)
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute('DROP TABLE IF EXISTS moments')
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.conn.executescript(SCHEMA)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+    
+    def refresh(self, workers=1, on_batch=None, batch_size=REFRESH_BATCH_SIZE, cancel_event=None):
+        """与文件系统同步索引，返回(新增或更新数, 删除数, 未变化数)
+
+        只对签名变化的文件夹重新读取内容；workers大于1时并发检查文件夹。
+        文件夹按batch_size分批处理，每批写入数据库后调用
+        on_batch(items, done, total)，items为该批的[(文件夹名, 时间戳, 图片数, 视频数)]。
+        cancel_event被设置后在批次之间停止（已处理的批次保留，不删除任何记录）。
+        """
+        known = {}
+        for folder, signature, image_count, video_count in self.conn.execute(
+                'SELECT folder, signature, image_count, video_count FROM moments'):
+            known[folder] = (signature, image_count, video_count)
+        folders = list_moment_folders(self.moments_dir)
+        check = functools.partial(_check_folder, self.moments_dir,
+                                  {folder: item[0] for folder, item in known.items()})
+        pool = ThreadPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+        
+        updated = unchanged = 0
+        present = set()
+        try:
+            for start in range(0, len(folders), batch_size):
+                if cancel_event is not None and cancel_event.is_set():
+                    return updated, 0, unchanged
+                batch = folders[start:start + batch_size]
+                results = pool.map(check, batch) if pool else map(check, batch)
+                items = []
+                with self.conn:
+                    for folder, (signature, row) in zip(batch, results):
+                        if signature is None:
+                            continue
+                        present.add(folder)
+                        if row is None:
+                            unchanged += 1
+                            _, image_count, video_count = known[folder]
+                            items.append((folder, to_timestamp(extract_datetime(folder)),
+                                          image_count, video_count))
+                            continue
+                        self.conn.execute(
+                            'INSERT OR REPLACE INTO moments '
+                            '(folder, ts, user, text, url, images, videos, image_count, video_count, '
+                            'media_mtimes, image_sizes, video_info, signature) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            row + (signature,))
+                        updated += 1
+                        items.append((folder, row[1], row[7], row[8]))
+                if on_batch is not None:
+                    on_batch(items, start + len(batch), len(folders))
+        finally:
+            if pool:
+                pool.shutdown(wait=True, cancel_futures=True)
+        
+        with self.conn:
+            removed = [folder for folder in known if folder not in present]
+            self.conn.executemany('DELETE FROM moments WHERE folder = ?',
+                                  [(folder,) for folder in removed])
+        return updated, len(removed), unchanged
+    
+    def _where(self, start, end):
+        """生成日期范围查询条件，start/end为datetime，包含两端"""
+        clauses, params = [], []
+        if start is not None:
+            clauses.append('ts >= ?')
+            params.append(to_timestamp(start))
+        if end is not None:
+            clauses.append('ts <= ?')
+            params.append(to_timestamp(end))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+    
+    def count(self, start=None, end=None):
+        """统计日期范围内的朋友圈数量"""
+        where, params = self._where(start, end)
+        return self.conn.execute(f'SELECT COUNT(*) FROM moments{where}', params).fetchone()[0]
+    
+    def date_range(self):
+        """返回(最早, 最新)朋友圈的日期时间，索引为空时返回(None, None)"""
+        first, last = self.conn.execute('SELECT MIN(ts), MAX(ts) FROM moments').fetchone()
+        if first is None:
+            return None, None
+        return from_timestamp(first), from_timestamp(last)
+    
+    def media_count(self):
+        """统计索引中的图片和视频文件总数"""
+        row = self.conn.execute(
+            'SELECT COALESCE(SUM(image_count), 0), COALESCE(SUM(video_count), 0) FROM moments').fetchone()
+        return row[0], row[1]
+    
+    def query(self, start=None, end=None, newest_first=True, limit=None):
+        """按时间顺序查询朋友圈，生成与collect_moments()相同的Moment对象"""
+        where, params = self._where(start, end)
+        order = 'DESC' if newest_first else 'ASC'
+        sql = (f'SELECT folder, ts, user, text, url, images, videos, image_sizes, video_info, signature '
+               f'FROM moments{where} '
+               f'ORDER BY ts {order}, folder {order}')
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        for (folder, ts, user, text, url, images, videos, image_sizes, video_info,
+             signature) in self.conn.execute(sql, params):
+            yield Moment(ts, user, folder, self.moments_dir, text, url, json.loads(images),
+                         json.loads(videos), json.loads(image_sizes), json.loads(video_info),
+                         json.loads(signature))
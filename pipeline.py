@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段的生产者/消费者流水线
+
+处理过程拆分为若干阶段，每个阶段有自己的线程池，上一阶段完成一项后下一阶段立即开始处理，
+不必等全部输入都完成上一阶段。读取文件等I/O操作会释放GIL，
+因此读取、渲染和写入可以在不同线程中同时进行。
+
+流水线中同时处理的输入数量有上限（有界队列）：消费者取走结果的速度跟不上时，
+提交新输入的线程会阻塞等待（背压），内存占用不会随输入数量增长。
+结果严格按输入顺序产出。
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+# 流水线中最多同时排队的输入数（不含正在被消费者处理的一项）
+PIPELINE_QUEUE_SIZE = 8
+
+# 输入全部提交完毕的标记
+_DONE = object()
+
+class Pipeline:
+    """按顺序经过多个阶段处理输入的流水线
+
+    stages为[(阶段名, 处理函数, 线程数)]，第一个阶段的处理函数接收输入，
+    之后每个阶段接收上一阶段的返回值。用法：
+
+        with Pipeline(stages) as pipeline:
+            for result in pipeline.run(items):
+                ...
+
+    任何阶段抛出的异常在消费者取到对应结果时重新抛出；离开with语句块时
+    （包括消费者中途退出）取消尚未开始的任务并等待正在执行的任务结束。
+    """
+    
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        # 各阶段处理函数的累计执行时间（秒），多个线程的时间相加
+        self.busy_seconds = {name: 0.0 for name, _, _ in stages}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pools = []
+        self._feeder = None
+        self._pending = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def _timed(self, name, func, arg):
+        start = time.perf_counter()
+        try:
+            return func(arg)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.busy_seconds[name] += elapsed
+    
+    def _after(self, name, func, upstream):
+        """等待上一阶段的结果后执行本阶段（上一阶段出错时把异常传给下一阶段）"""
+        return self._timed(name, func, upstream.result())
+    
+    def _feed(self, items):
+        """提交线程：为每个输入依次提交各阶段的任务，队列满时阻塞"""
+        try:
+            for item in items:
+                if self._stop.is_set():
+                    return
+                future = None
+                for pool, (name, func, _) in zip(self._pools, self.stages):
+                    if future is None:
+                        future = pool.submit(self._timed, name, func, item)
+                    else:
+                        future = pool.submit(self._after, name, func, future)
+                self._pending.put(future)
+        except BaseException as e:
+            failed = Future()
+            failed.set_exception(e)
+            self._pending.put(failed)
+        finally:
+            self._pending.put(_DONE)
+    
+    def run(self, items):
+        """开始处理items，按输入顺序生成最后一个阶段的结果"""
+        self._pools = [ThreadPoolExecutor(max_workers=max(1, workers or 1),
+                                          thread_name_prefix=f'pipeline-{name}')
+                       for name, _, workers in self.stages]
+        self._pending = queue.Queue(maxsize=self.queue_size)
+        self._feeder = threading.Thread(target=self._feed, args=(items,), daemon=True)
+        self._feeder.start()
+        while True:
+            future = self._pending.get()
+            if future is _DONE:
+                return
+            yield future.result()
+    
+    def close(self):
+        """停止提交新输入，取消排队中的任务并等待所有线程结束"""
+        self._stop.set()
+        if self._feeder is not None:
+            # 取走队列中剩余的任务，使阻塞在put上的提交线程可以结束
+            while self._feeder.is_alive() or not self._pending.empty():
+                try:
+                    future = self._pending.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                if future is not _DONE:
+                    future.cancel()
+            self._feeder = None
+        for pool in self._pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+        self._pools = []
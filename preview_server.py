@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+朋友圈HTML生成器 - 本地预览服务器
+
+以朋友圈根目录为根提供HTTP访问，代替file://打开生成的页面：
+- 支持Range请求（视频可以拖动进度，只传输需要的部分，使用sendfile发送文件内容）
+- 按ETag/Last-Modified重新验证，未变化的文件返回304
+- HTML/JSON/CSS/JS按gzip压缩传输：边读取边分块压缩、以chunked编码发送，
+  不需要先把整个文件压缩到内存中；不太大的压缩结果按ETag缓存（缓存总大小有上限）
+- 请求由固定大小的线程池处理
+
+用法示例:
+    python preview_server.py /Users/mac/Desktop/moments --port 8000
+"""
+
+import os
+import zlib
+import argparse
+import threading
+import functools
+import http.server
+import urllib.parse
+import email.utils
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 默认监听地址（只允许本机访问）
+DEFAULT_HOST = '127.0.0.1'
+# 处理请求的线程数
+PREVIEW_WORKERS = 8
+# 空闲的保持连接多少秒后关闭（避免占住线程池）
+KEEP_ALIVE_TIMEOUT = 15
+# 需要gzip压缩传输的内容类型
+COMPRESSIBLE_TYPES = frozenset({'text/html', 'text/css', 'text/plain', 'application/json',
+                                'application/javascript', 'text/javascript'})
+# gzip压缩级别
+GZIP_LEVEL = 6
+# 压缩时每次读取的字节数
+GZIP_CHUNK_SIZE = 256 * 1024
+# 压缩结果缓存的总大小上限（字节）
+GZIP_CACHE_BYTES = 64 * 1024 * 1024
+# 压缩后超过该大小的文件不缓存，每次请求重新压缩
+GZIP_CACHE_MAX_ENTRY = 8 * 1024 * 1024
+
+def gzip_chunks(f, chunk_size=GZIP_CHUNK_SIZE, level=GZIP_LEVEL):
+    """按块读取文件f，逐块生成gzip格式的压缩数据（内存占用与文件大小无关）"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+class GzipCache:
+    """按(路径, ETag)缓存压缩后的内容，文件变化后ETag不同，自动重新压缩
+
+    按最近使用顺序淘汰，缓存内容的总大小不超过max_bytes；超过max_entry的压缩结果不缓存。
+    """
+    
+    def __init__(self, max_bytes=GZIP_CACHE_BYTES, max_entry=GZIP_CACHE_MAX_ENTRY):
+        self.max_bytes = max_bytes
+        self.max_entry = min(max_entry, max_bytes)
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, path, etag):
+        """返回缓存的压缩内容，没有缓存或文件已变化时返回None"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == etag:
+                self._entries.move_to_end(path)
+                return entry[1]
+        return None
+    
+    def put(self, path, etag, body):
+        """缓存压缩内容，淘汰最久未使用的条目直到总大小不超过上限"""
+        if len(body) > self.max_entry:
+            return
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old:
+                self.size -= len(old[1])
+            self._entries[path] = (etag, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+def parse_range(header, size):
+    """解析单个字节范围的Range请求头，返回(起始, 结束)（含两端）
+    
+    不是单个bytes范围（如多个范围）时返回None，按完整文件响应；
+    范围无法满足时返回False（416）。
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            if not last:
+                return None
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+class PreviewRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """静态文件请求处理：Range、条件请求和gzip压缩；目录请求交给SimpleHTTPRequestHandler"""
+    
+    server_version = "MomentsPreview/1.0"
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+    extensions_map = dict(http.server.SimpleHTTPRequestHandler.extensions_map, **{
+        '.mp4': 'video/mp4',
+        '.mov': 'video/quicktime',
+        '.avi': 'video/x-msvideo',
+        '.js': 'application/javascript',
+        '.json': 'application/json',
+    })
+    
+    def do_GET(self):
+        self._serve(head_only=False)
+    
+    def do_HEAD(self):
+        self._serve(head_only=True)
+    
+    def log_message(self, format, *args):
+        if getattr(self.server, 'verbose', False):
+            super().log_message(format, *args)
+    
+    def _serve(self, head_only):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            f = self.send_head()
+            if f:
+                try:
+                    if not head_only:
+                        self.copyfile(f, self.wfile)
+                finally:
+                    f.close()
+            return
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            gzip_etag = etag[:-1] + '-gz"'
+            last_modified = self.date_time_string(int(st.st_mtime))
+            content_type = self.guess_type(path)
+            validators = {'ETag': etag, 'Last-Modified': last_modified,
+                          'Cache-Control': 'no-cache', 'Accept-Ranges': 'bytes'}
+            
+            if self._not_modified((etag, gzip_etag), st.st_mtime):
+                self.send_response(304)
+                self._send_headers(validators)
+                return
+            
+            size = st.st_size
+            byte_range = None
+            range_header = self.headers.get('Range')
+            if range_header and self._if_range_matches(etag, last_modified):
+                byte_range = parse_range(range_header, size)
+                if byte_range is False:
+                    self.send_response(416)
+                    self._send_headers({'Content-Range': f'bytes */{size}', 'Content-Length': '0'})
+                    return
+            
+            compressible = content_type.split(';')[0] in COMPRESSIBLE_TYPES
+            if byte_range is None and compressible and self._accepts_gzip():
+                self._send_gzip(path, f, etag, dict(validators, **{
+                    'ETag': gzip_etag, 'Content-Type': content_type, 'Content-Encoding': 'gzip',
+                    'Vary': 'Accept-Encoding'}), head_only)
+                return
+            
+            headers = dict(validators, **{'Content-Type': content_type})
+            if compressible:
+                headers['Vary'] = 'Accept-Encoding'
+            if byte_range:
+                start, end = byte_range
+                self.send_response(206)
+                headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            else:
+                start, end = 0, size - 1
+                self.send_response(200)
+            headers['Content-Length'] = str(end - start + 1)
+            self._send_headers(headers)
+            if not head_only and end >= start:
+                self.wfile.flush()
+                # socket.sendfile()在支持的系统上使用sendfile系统调用，否则退回普通发送
+                self.connection.sendfile(f, start, end - start + 1)
+    
+    def _send_gzip(self, path, f, etag, headers, head_only):
+        """发送gzip压缩的文件内容：有缓存时直接发送，否则边压缩边以chunked编码发送
+
+        HTTP/1.0客户端不支持chunked编码，改为发送完毕后关闭连接。
+        压缩结果不超过缓存的单条上限时，发送的同时收集起来放入缓存。
+        """
+        gzip_cache = self.server.gzip_cache
+        body = gzip_cache.get(path, etag)
+        self.send_response(200)
+        if body is not None:
+            self._send_headers(dict(headers, **{'Content-Length': str(len(body))}))
+            if not head_only:
+                self.wfile.write(body)
+            return
+        
+        chunked = self.request_version != 'HTTP/1.0'
+        if chunked:
+            headers['Transfer-Encoding'] = 'chunked'
+        else:
+            headers['Connection'] = 'close'
+            self.close_connection = True
+        self._send_headers(headers)
+        if head_only:
+            return
+        
+        collected, collected_size = [], 0
+        for data in gzip_chunks(f):
+            if not data:
+                continue
+            if chunked:
+                self.wfile.write(b'%X\r\n%s\r\n' % (len(data), data))
+            else:
+                self.wfile.write(data)
+            if collected is not None:
+                collected.append(data)
+                collected_size += len(data)
+                if collected_size > gzip_cache.max_entry:
+                    collected = None
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+        if collected is not None:
+            gzip_cache.put(path, etag, b''.join(collected))
+    
+    def _send_headers(self, headers):
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+    
+    def _not_modified(self, etags, mtime):
+        """按If-None-Match（优先）或If-Modified-Since判断客户端缓存是否仍然有效"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            candidates = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in candidates or any(tag.replace('W/', '', 1) in etags for tag in candidates)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since is not None and since.tzinfo is not None:
+                return int(mtime) <= since.timestamp()
+        return False
+    
+    def _if_range_matches(self, etag, last_modified):
+        """没有If-Range或If-Range与当前文件一致时才按Range响应"""
+        if_range = self.headers.get('If-Range')
+        return if_range is None or if_range.strip() in (etag, last_modified)
+    
+    def _accepts_gzip(self):
+        accept = self.headers.get('Accept-Encoding', '')
+        return any(part.split(';')[0].strip() == 'gzip' for part in accept.split(','))
+
+class PreviewHTTPServer(http.server.HTTPServer):
+    """用固定大小的线程池处理连接的HTTP服务器"""
+    
+    def __init__(self, address, handler, workers=PREVIEW_WORKERS, verbose=False):
+        super().__init__(address, handler)
+        self.verbose = verbose
+        self.gzip_cache = GzipCache()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+    
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+    
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+    
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+class PreviewServer:
+    """在后台线程中运行的预览服务器，以root为根目录"""
+    
+    def __init__(self, root, host=DEFAULT_HOST, port=0, workers=PREVIEW_WORKERS, verbose=False):
+        self.root = os.path.abspath(root)
+        handler = functools.partial(PreviewRequestHandler, directory=self.root)
+        self.httpd = PreviewHTTPServer((host, port), handler, workers=workers, verbose=verbose)
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = None
+    
+    def start(self):
+        """在后台线程中开始服务"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """停止服务并关闭监听端口"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/"
+    
+    def url_for(self, path):
+        """根目录下文件的访问地址，文件不在根目录下时抛出ValueError"""
+        rel_path = os.path.relpath(os.path.abspath(path), self.root)
+        if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep):
+            raise ValueError(f"文件不在预览根目录中: {path}")
+        return self.base_url + urllib.parse.quote(rel_path.replace(os.sep, '/'))
+
+def main():
+    """主函数"""
+    from direct_html_generator import MOMENTS_DIR
+    
+    parser = argparse.ArgumentParser(description="以朋友圈根目录为根启动本地预览服务器")
+    parser.add_argument('root', nargs='?', default=MOMENTS_DIR,
+                        help="朋友圈根目录（默认: %(default)s）")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="监听地址（默认: %(default)s）")
+    parser.add_argument('--port', type=int, default=8000, help="监听端口（默认: %(default)s）")
+    parser.add_argument('--workers', type=int, default=PREVIEW_WORKERS,
+                        help="处理请求的线程数（默认: %(default)s）")
+    args = parser.parse_args()
+    
+    server = PreviewServer(args.root, args.host, args.port, args.workers, verbose=True)
+    print(f"预览服务器已启动: {server.base_url}（Ctrl+C退出）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("已停止预览服务器")
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
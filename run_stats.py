@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成过程的统计信息
+
+记录一次生成中各阶段的耗时和计数（扫描的文件夹、读取的文件和字节数、媒体数量等），
+生成结束后写成JSON运行报告，也可以转换为适合在日志中显示的摘要。
+"""
+
+import json
+import time
+import datetime
+import threading
+import contextlib
+
+# 报告中阶段的显示顺序及名称
+# 使用流水线时parse和render为各线程执行时间之和（线程秒），可能超过流水线（pipeline）的总耗时
+STAGE_LABELS = {
+    'scan': '扫描目录',
+    'parse': '读取内容',
+    'sort': '排序',
+    'merge': '合并去重',
+    'thumbnails': '缩略图',
+    'render': '渲染',
+    'write': '写入',
+    'pipeline': '流水线',
+    'search': '搜索索引',
+    'export': '导出媒体',
+}
+
+# 报告中计数项的显示顺序及名称
+COUNTER_LABELS = {
+    'folders_seen': '目录项',
+    'folders_skipped': '跳过',
+    'folders_filtered': '筛选排除',
+    'folders_accepted': '朋友圈',
+    'duplicates_merged': '合并去除重复',
+    'cache_hits': '缓存命中',
+    'fragments_cached': '片段缓存命中',
+    'files_stat': 'stat次数',
+    'files_read': '读取文件',
+    'bytes_read': '读取字节',
+    'images_probed': '探测图片尺寸',
+    'videos_probed': '探测视频信息',
+    'images': '图片',
+    'videos': '视频',
+    'media_copied': '导出媒体文件',
+    'media_reused': '复用已导出媒体',
+}
+
+class RunStats:
+    """一次生成的各阶段耗时（秒）和计数，可在多个线程中同时累加"""
+    
+    def __init__(self):
+        self.started_at = datetime.datetime.now()
+        self.stages = {}
+        self.counters = {}
+        self.total_seconds = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+    
+    @contextlib.contextmanager
+    def stage(self, name):
+        """统计with语句块的耗时，累加到指定阶段"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+    
+    def add_time(self, name, seconds):
+        """累加阶段耗时"""
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+    
+    def incr(self, name, value=1):
+        """累加计数"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    
+    def finish(self):
+        """记录总耗时"""
+        self.total_seconds = time.perf_counter() - self._start
+    
+    def to_dict(self, **extra):
+        """转换为报告字典，extra为附加字段（如目录、输出文件、选项）"""
+        report = {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'total_seconds': self.total_seconds,
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+        report.update(extra)
+        return report
+    
+    def write_report(self, path, **extra):
+        """将报告写成JSON文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(**extra), f, ensure_ascii=False, indent=2)
+    
+    def summary_lines(self):
+        """生成适合在日志中逐行显示的摘要"""
+        stage_names = [name for name in STAGE_LABELS if name in self.stages]
+        stage_names += [name for name in self.stages if name not in STAGE_LABELS]
+        lines = []
+        if self.total_seconds is not None:
+            lines.append(f"总耗时 {self.total_seconds:.2f}s")
+        lines.append("阶段耗时: " + "，".join(
+            f"{STAGE_LABELS.get(name, name)} {self.stages[name]:.2f}s" for name in stage_names))
+        counter_names = [name for name in COUNTER_LABELS if name in self.counters]
+        counter_names += [name for name in self.counters if name not in COUNTER_LABELS]
+        lines.append("计数: " + "，".join(
+            f"{COUNTER_LABELS.get(name, name)} {self.counters[name]}" for name in counter_names))
+        return lines
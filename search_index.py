@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+朋友圈全文搜索索引
+
+生成HTML时对text.txt和url.txt的内容建立倒排索引：中日韩文字按单字和相邻两字（二元组）切分，
+英文和数字按单词切分。查询时两字以上的中日韩片段只取二元组，单字查询使用单字词项。倒排表按词项哈希分片，文档信息按编号分块，页面搜索时只加载
+查询词所在的分片和结果所在的文档块，不需要扫描全部朋友圈。
+"""
+
+import os
+import re
+import json
+
+# 倒排表分片数
+SEARCH_SHARDS = 64
+# 每个文档信息块包含的朋友圈条数
+DOC_CHUNK_SIZE = 1000
+# 搜索结果中显示的文本摘要长度
+SNIPPET_LENGTH = 80
+
+# 中日韩文字连续片段或英文数字单词（页面脚本切分查询词时使用相同的规则）
+TOKEN_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uac00-\ud7af]+|[a-z0-9]+')
+
+def tokenize(text):
+    """将文本切分为建立索引的词项集合：中日韩文字取每个单字和二元组，英文数字取长度至少为2的单词
+
+    页面脚本切分查询词时，两字以上的中日韩片段只取二元组，单字片段取单字，
+    因此单字查询也能匹配出现在较长片段中的字。
+    """
+    tokens = set()
+    for run in TOKEN_PATTERN.findall(text.lower()):
+        if run[0] <= 'z':
+            if len(run) >= 2:
+                tokens.add(run)
+        else:
+            tokens.update(run)
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def token_shard(token, shards=SEARCH_SHARDS):
+    """词项所在的分片号：UTF-8编码的32位FNV-1a哈希取模（与页面脚本一致）"""
+    value = 0x811c9dc5
+    for byte in token.encode('utf-8'):
+        value = ((value ^ byte) * 0x01000193) & 0xffffffff
+    return value % shards
+
+def search_dir_for(output_file):
+    """搜索索引所在的目录：与输出文件同名加_search后缀"""
+    root, _ = os.path.splitext(output_file)
+    return f"{root}_search"
+
+def _write_if_changed(path, text):
+    """内容与现有文件不同时才写入，返回是否写入"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == text:
+                return False
+    except OSError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return True
+
+def write_search_index(output_file, entries, shards=SEARCH_SHARDS, doc_chunk_size=DOC_CHUNK_SIZE):
+    """写入搜索索引，返回(词项数, 重写的文件数)
+
+    entries为按页面顺序排列的(朋友圈, 所在页面, 锚点)，文档编号即其在entries中的位置。
+    倒排表以差值编码的文档编号列表保存；内容未变化的分片和文档块不会重写。
+    """
+    search_dir = search_dir_for(output_file)
+    os.makedirs(search_dir, exist_ok=True)
+    postings = {}
+    docs = []
+    
+    for doc_id, (moment, page, anchor) in enumerate(entries):
+        for token in tokenize(f"{moment.text}\n{moment.url}"):
+            postings.setdefault(token, []).append(doc_id)
+        snippet = moment.text or moment.url
+        if len(snippet) > SNIPPET_LENGTH:
+            snippet = snippet[:SNIPPET_LENGTH] + '…'
+        docs.append([moment.datetime.strftime('%Y年%m月%d日 %H:%M'), page, anchor, snippet])
+    
+    # 倒排表分片（文档编号递增，保存相邻差值使数字更短）
+    shard_postings = [{} for _ in range(shards)]
+    for token, doc_ids in postings.items():
+        deltas = [doc_ids[0]] + [b - a for a, b in zip(doc_ids, doc_ids[1:])]
+        shard_postings[token_shard(token, shards)][token] = deltas
+    
+    written = 0
+    for i, data in enumerate(shard_postings):
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+        written += _write_if_changed(os.path.join(search_dir, f"shard-{i}.js"),
+                                     f"window.__momentsSearchShard({i},{payload});\n")
+    
+    doc_chunks = 0
+    for start in range(0, len(docs), doc_chunk_size):
+        payload = json.dumps(docs[start:start + doc_chunk_size], ensure_ascii=False, separators=(',', ':'))
+        written += _write_if_changed(os.path.join(search_dir, f"docs-{doc_chunks}.js"),
+                                     f"window.__momentsSearchDocs({doc_chunks},{payload});\n")
+        doc_chunks += 1
+    
+    # 删除多余的旧文档块
+    for name in os.listdir(search_dir):
+        match = re.fullmatch(r'docs-([0-9]+)\.js', name)
+        if match and int(match.group(1)) >= doc_chunks:
+            os.remove(os.path.join(search_dir, name))
+    
+    return len(postings), written
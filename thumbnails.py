@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+朋友圈图片缩略图生成
+
+缩略图按原图内容哈希命名并缓存在朋友圈根目录的.thumbnails目录下，
+内容未变化的图片不会重新编码；需要生成的缩略图在进程池中并行处理。
+依赖Pillow，未安装时跳过缩略图生成。
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from content_hash import FileHashCache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# 缩略图目录名（保存在朋友圈根目录下）
+THUMB_DIR_NAME = '.thumbnails'
+# 原图内容哈希缓存文件名（保存在缩略图目录下）
+HASH_CACHE_NAME = 'hashes.json'
+# 缩略图短边像素数（页面以180x180显示，按2倍分辨率生成）
+THUMB_SIZE = 360
+# 缩略图JPEG质量
+THUMB_QUALITY = 80
+
+def pillow_available():
+    """是否安装了Pillow"""
+    return Image is not None
+
+def _make_thumbnail(src_path, thumb_path, size):
+    """生成单张缩略图（在子进程中执行），成功返回True"""
+    tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+    try:
+        with Image.open(src_path) as img:
+            # JPEG可在解码时直接按比例缩小，避免解码完整分辨率
+            img.draft('RGB', (size, size))
+            img = ImageOps.exif_transpose(img)
+            width, height = img.size
+            scale = size / min(width, height)
+            if scale < 1:
+                img = img.resize((max(1, round(width * scale)), max(1, round(height * scale))),
+                                 Image.LANCZOS)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.save(tmp_path, 'JPEG', quality=THUMB_QUALITY, optimize=True)
+        os.replace(tmp_path, thumb_path)
+        return True
+    except Exception as e:
+        print(f"生成缩略图失败 {src_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+def build_thumbnails(moments_dir, image_paths, size=THUMB_SIZE, workers=None,
+                     progress=None, cancel_event=None, prune=True):
+    """为图片生成缩略图，返回{原图路径: 缩略图路径}
+
+    原图按内容哈希去重，已存在的缩略图直接复用；workers为进程池大小，
+    默认使用CPU核数。生成失败的图片不在返回结果中，页面会继续引用原图。
+    progress(done, total)报告缩略图生成进度；cancel_event被设置后不再提交新任务并尽快返回。
+    prune为True时从哈希缓存中清除本次未用到的图片；只为筛选后的部分图片生成时应传入False。
+    """
+    if not pillow_available():
+        print("未安装Pillow，跳过缩略图生成（可通过 pip install Pillow 安装）")
+        return {}
+    
+    thumb_dir = os.path.join(moments_dir, THUMB_DIR_NAME)
+    os.makedirs(thumb_dir, exist_ok=True)
+    hash_cache = FileHashCache(os.path.join(thumb_dir, HASH_CACHE_NAME))
+    
+    def safe_hash(path):
+        try:
+            return hash_cache.hash_file(path)
+        except OSError as e:
+            print(f"读取图片失败 {path}: {e}")
+            return None
+    
+    # 计算原图内容哈希（以I/O为主，使用线程池）
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        digests = list(pool.map(safe_hash, image_paths))
+    
+    existing = set(os.listdir(thumb_dir))
+    thumbs = {}
+    pending = {}
+    for path, digest in zip(image_paths, digests):
+        if digest is None:
+            continue
+        thumb_name = f"{digest}_{size}.jpg"
+        thumb_path = os.path.join(thumb_dir, thumb_name)
+        if thumb_name in existing:
+            thumbs[path] = thumb_path
+        else:
+            pending.setdefault(thumb_path, []).append(path)
+    
+    # 编码缺失的缩略图（以CPU为主，使用进程池）
+    if pending:
+        print(f"正在生成 {len(pending)} 张缩略图...")
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = {pool.submit(_make_thumbnail, paths[0], thumb_path, size): thumb_path
+                       for thumb_path, paths in pending.items()}
+            for done, future in enumerate(as_completed(futures), 1):
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                thumb_path = futures[future]
+                if future.result():
+                    for path in pending[thumb_path]:
+                        thumbs[path] = thumb_path
+                if progress is not None:
+                    progress(done, len(futures))
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    hash_cache.save(prune=prune)
+    return thumbs
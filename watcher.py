@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+朋友圈目录监视
+
+监视朋友圈根目录中新增、删除或修改的朋友圈文件夹，变化停止一段时间（防抖）后
+以变化的文件夹名集合回调。Linux上使用inotify（通过ctypes调用，无需额外依赖），
+其他平台或inotify不可用时退回到定期比较文件夹修改时间的轮询方式。
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+from direct_html_generator import FOLDER_PATTERN
+
+# 变化停止多少秒后触发回调
+DEBOUNCE_SECONDS = 2.0
+# 轮询方式下两次扫描之间的间隔秒数
+POLL_INTERVAL = 5.0
+
+# inotify事件掩码（见inotify(7)）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+def _load_libc():
+    """加载带inotify接口的libc，不可用时返回None"""
+    if not hasattr(os, 'uname') or os.uname().sysname != 'Linux':
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+class InotifySource:
+    """基于inotify的变化来源：监视根目录及每个朋友圈文件夹"""
+    
+    def __init__(self, moments_dir, libc):
+        self.moments_dir = moments_dir
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        self.folders = {}
+        self._add_watch(moments_dir, None)
+        with os.scandir(moments_dir) as it:
+            for entry in it:
+                if FOLDER_PATTERN.search(entry.name) and entry.is_dir():
+                    self._add_watch(entry.path, entry.name)
+    
+    def _add_watch(self, path, folder):
+        """添加监视，监视数量超过系统上限时抛出OSError"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if folder is not None and err == errno.ENOENT:
+                return
+            raise OSError(err, f"inotify_add_watch失败: {path}")
+        self.folders[wd] = folder
+    
+    def wait(self, timeout):
+        """等待最多timeout秒，返回变化的文件夹名集合；事件队列溢出时返回None（需要全量检查）"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self.folders.pop(wd, None)
+                continue
+            folder = self.folders.get(wd)
+            if folder is None:
+                # 根目录中的事件：只关心朋友圈文件夹，忽略生成的HTML、缓存等文件
+                if not FOLDER_PATTERN.search(name):
+                    continue
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_watch(os.path.join(self.moments_dir, name), name)
+                changed.add(name)
+            else:
+                changed.add(folder)
+        return changed
+    
+    def close(self):
+        os.close(self.fd)
+
+class PollingSource:
+    """轮询方式的变化来源：定期比较根目录下各朋友圈文件夹的修改时间
+
+    文件夹中增删文件会改变其修改时间；原地改写已有文件不会，需等到下次全量生成时更新。
+    """
+    
+    def __init__(self, moments_dir, interval=POLL_INTERVAL):
+        self.moments_dir = moments_dir
+        self.interval = interval
+        self.snapshot = self._scan()
+        self.next_scan = time.monotonic() + interval
+    
+    def _scan(self):
+        snapshot = {}
+        with os.scandir(self.moments_dir) as it:
+            for entry in it:
+                if FOLDER_PATTERN.search(entry.name) and entry.is_dir():
+                    try:
+                        snapshot[entry.name] = entry.stat().st_mtime_ns
+                    except OSError:
+                        pass
+        return snapshot
+    
+    def wait(self, timeout):
+        """等待最多timeout秒，到达轮询时间时扫描并返回变化的文件夹名集合"""
+        time.sleep(max(0, min(timeout, self.next_scan - time.monotonic())))
+        if time.monotonic() < self.next_scan:
+            return set()
+        self.next_scan = time.monotonic() + self.interval
+        snapshot = self._scan()
+        changed = {name for name in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(name) != self.snapshot.get(name)}
+        self.snapshot = snapshot
+        return changed
+    
+    def close(self):
+        pass
+
+def open_source(moments_dir, poll_interval=POLL_INTERVAL):
+    """优先使用inotify，不可用（非Linux或监视数超过上限）时使用轮询"""
+    libc = _load_libc()
+    if libc is not None:
+        try:
+            return InotifySource(moments_dir, libc)
+        except OSError as e:
+            print(f"inotify不可用，改用轮询方式: {e}")
+    return PollingSource(moments_dir, poll_interval)
+
+def watch(moments_dir, on_change, stop_event=None, debounce=DEBOUNCE_SECONDS,
+          poll_interval=POLL_INTERVAL):
+    """监视朋友圈目录直到stop_event被设置（或按Ctrl+C）
+
+    变化停止debounce秒后调用on_change(folders)，folders为变化的文件夹名集合，
+    无法确定具体变化时为None。回调在当前线程中执行，执行期间的变化会在之后合并处理。
+    """
+    stop_event = stop_event or threading.Event()
+    source = open_source(moments_dir, poll_interval)
+    print(f"正在监视 {moments_dir}（{'inotify' if isinstance(source, InotifySource) else '轮询'}）")
+    pending = set()
+    full_rescan = False
+    last_change = None
+    try:
+        while not stop_event.is_set():
+            timeout = 0.5 if last_change is None else max(0.05, last_change + debounce - time.monotonic())
+            changed = source.wait(timeout)
+            if changed is None:
+                full_rescan = True
+                last_change = time.monotonic()
+            elif changed:
+                pending |= changed
+                last_change = time.monotonic()
+            
+            if last_change is not None and time.monotonic() - last_change >= debounce:
+                folders = None if full_rescan else pending
+                pending, full_rescan, last_change = set(), False, None
+                on_change(folders)
+    finally:
+        source.close()